@@ -23,19 +23,15 @@ class MainPage(lib.Pages.PageWithTitle):
 
     def pause(self):
         self.flag = False
+        self.book.base.env.Power.remove_tick(self.clock_updater)
 
-    def clock_updater(self):
-        last_clock = time.strftime("%H:%M", time.localtime())
-        while self.flag:
-            time.sleep(2)
-            now = time.strftime("%H:%M", time.localtime())
-            if last_clock != now:
-                self.clock.set_text(now)
-                last_clock = now
+    def clock_updater(self):  # 由env.Power每分钟调用
+        self.clock.set_text(time.strftime("%H:%M", time.localtime()))
 
     def active(self):
         self.flag = True
         self.clock.set_text(time.strftime("%H:%M", time.localtime()), False)
+        self.book.base.env.Power.add_tick(self.clock_updater)
 
 
 class MainBook(struct.Book):
@@ -100,14 +100,8 @@ class CountPage(lib.Pages.PageWithTitle):
         self.clock = self.add_element(lib.Elements.Label(self, (0, 0), size=(296, 30), border=(5, 8), font_size=16,
                                                          align="right"))
 
-    def clock_updater(self):
-        last_clock = time.strftime("%H:%M", time.localtime())
-        while self.flag:
-            time.sleep(2)
-            now = time.strftime("%H:%M", time.localtime())
-            if last_clock != now:
-                self.clock.set_text(now)
-                last_clock = now
+    def clock_updater(self):  # 由env.Power每分钟调用
+        self.clock.set_text(time.strftime("%H:%M", time.localtime()))
 
     def time_updater(self):
         time.sleep(2)
@@ -141,11 +135,12 @@ class CountPage(lib.Pages.PageWithTitle):
         self.last_time.set_text(text)
         self.book.base.env.Pool.add(self.time_updater)
         self.clock.set_text(time.strftime("%H:%M", time.localtime()), False)
-        self.book.base.env.Pool.add(self.clock_updater)
+        self.book.base.env.Power.add_tick(self.clock_updater)
         super().active()
 
     def pause(self):
         self.flag = False
+        self.book.base.env.Power.remove_tick(self.clock_updater)
 
     def control(self):
         if self.book.cont_down_timer.Timer.is_alive():
@@ -75,31 +75,26 @@ class WordsPage(struct.Page):
 
     def pause(self):
         self.flag = False
+        self.book.base.env.Power.remove_tick(self.clock_updater)
         self.nexter.cancel()
 
-    def clock_updater(self):
-        last_clock = time.strftime("%H:%M", time.localtime())
-        while self.flag:
-            time.sleep(2)
-            now = time.strftime("%H:%M", time.localtime())
-            if last_clock != now:
-                self.clock.set_text(now)
-                last_clock = now
+    def clock_updater(self):  # 由env.Power每分钟调用
+        self.clock.set_text(time.strftime("%H:%M", time.localtime()))
 
     def active(self):
         self.flag = True
         self.clock.set_text(time.strftime("%H:%M", time.localtime()), False)
-        self.book.base.env.Pool.add(self.clock_updater)
+        self.book.base.env.Power.add_tick(self.clock_updater)
         self.nexter.start()
 
     def go_prev(self):
         if self.prev_stack.empty():
-            self.book.base.display("t")
+            self.book.base.display()
         else:
             new = self.prev_stack.get()
             self.word.set_text(new[0], False)
             self.mean.set_text(new[1], False)
-            self.update(refresh="t")
+            self.update()
 
         self.nexter.reset()
 
@@ -117,7 +112,7 @@ class WordsPage(struct.Page):
 
         self.word.set_text(new[0], False)
         self.mean.set_text(new[1], False)
-        self.update(refresh="t")
+        self.update()
 
         if i:
             self.nexter.reset()
@@ -24,14 +24,18 @@ class TodayPage(struct.Page):
 
     def get_weather(self):
         if self.forcast.is_inited():
-            self.title.set_text(self.forcast.city)
+            # 先取得数据(可能需要联网)，再一次性更新页面
             realtime = self.forcast.get_realtime()
-            self.now_temp.set_text(realtime.temp + "℃", False)
-            self.text.set_text(realtime.text, False)
-            self.weather_icon.set_image(self.forcast.get_image(realtime.icon_id, 44), True)
+            icon = self.forcast.get_image(realtime.icon_id, 44)
             more = self.forcast.get_more()
-            self.temp_range.set_text(f"{more[0].temp_min}-{more[0].temp_max}℃")
-            self.summary_text.set_text(self.forcast.get_summary())
+            summary = self.forcast.get_summary()
+            with self.batch():
+                self.title.set_text(self.forcast.city)
+                self.now_temp.set_text(realtime.temp + "℃")
+                self.text.set_text(realtime.text)
+                self.weather_icon.set_image(icon)
+                self.temp_range.set_text(f"{more[0].temp_min}-{more[0].temp_max}℃")
+                self.summary_text.set_text(summary)
         else:
             self.title.set_text("网络错误")
 
@@ -20,10 +20,10 @@ status = {
 
 class Time(lib.Elements.TextElement):
     def update(self, display=True, refresh="a"):
-        self.image = self.background.copy()
-        self._image_draw = ImageDraw.ImageDraw(self.image)
         if len(self.text) == 1:
             self.text = "0" + self.text
+        self.image = self._new_image(self._font.getbbox(self.text)[2:])
+        self._image_draw = ImageDraw.ImageDraw(self.image)
         self._image_draw.text((0, 0), self.text, self.color, self._font)
         self.page.update(display, refresh)
 
@@ -73,13 +73,9 @@ class MainPage(lib.Pages.PageWithTitle):
         self.status_text.set_text("开始计时", False)
         self.time.set_text(str(self.work_time))
 
-    def clock_updater(self):
-        while self.flag:
-            time.sleep(2)
-            now = time.strftime("%H:%M", time.localtime())
-            if self.last_clock != now:
-                self.last_clock = now
-                self.clock.set_text(self.last_clock)
+    def clock_updater(self):  # 由env.Power每分钟调用
+        self.last_clock = time.strftime("%H:%M", time.localtime())
+        self.clock.set_text(self.last_clock)
 
     def timer_func(self, long):
         self.last = long
@@ -143,10 +139,11 @@ class MainPage(lib.Pages.PageWithTitle):
         self.last_clock = time.strftime("%H:%M", time.localtime())
         self.clock.set_text(self.last_clock, False)
         self.flag = True
-        self.env.Pool.add(self.clock_updater)
+        self.env.Power.add_tick(self.clock_updater)
 
     def pause(self):
         self.flag = False
+        self.env.Power.remove_tick(self.clock_updater)
 
     def start(self):
         pass
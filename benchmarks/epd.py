@@ -0,0 +1,47 @@
+# 水墨屏驱动SPI传输次数基准测试，不需要硬件，在仓库根目录运行：python3 -m benchmarks.epd
+from enviroment.drivers import standin
+
+standin.install()
+
+from enviroment.drivers import epdconfig, epd2in9_V2, framebuffer  # noqa: E402
+
+_BULK = (0x24, 0x26, 0x32)  # 原实现中用send_data2一次写入的命令
+
+
+def bytewise(epd, sequence):  # 按原实现逐字节发送同一个序列，作为对照
+    for step in sequence.steps:
+        if step is None:
+            epd.wait_busy()
+            continue
+        command, data = step
+        epd.send_command(command)
+        if command in _BULK:
+            epd.send_data2(data)
+        else:
+            for i in data:
+                epd.send_data(i)
+
+
+def measure(name, epd, sequence):
+    result = []
+    for run in (bytewise, lambda e, s: s.run(e)):
+        standin.counters.reset()
+        run(epd, sequence)
+        result.append(standin.counters.report)
+    before, after = result
+    print(f"{name}: spi {before['spi_transfers']} -> {after['spi_transfers']}, "
+          f"gpio {before['gpio_writes']} -> {after['gpio_writes']}")
+
+
+def main():
+    epdconfig.module_init()
+    epd = epd2in9_V2.Epd2in9V2()
+    buffer = bytes(framebuffer.EPD_WIDTH // 8 * framebuffer.EPD_HEIGHT)
+    region = (2, 40, 5, 80)
+    measure("init", epd, epd.INIT)
+    measure("partial (full screen)", epd, epd.partial_sequence(buffer))
+    measure("partial (window)", epd, epd.partial_sequence(framebuffer.crop(buffer, region), region))
+
+
+if __name__ == "__main__":
+    main()
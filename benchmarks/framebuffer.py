@@ -0,0 +1,38 @@
+# 帧缓冲打包基准测试，在仓库根目录运行：python3 -m benchmarks.framebuffer
+import random
+import time
+
+from PIL import Image, ImageDraw
+
+from enviroment.drivers import framebuffer
+
+
+def sample_images():
+    horizontal = Image.open("resources/images/raspberry.jpg").convert("RGBA").resize((296, 128))
+    draw = ImageDraw.Draw(horizontal)
+    rnd = random.Random(0)
+    for _ in range(40):
+        x, y = rnd.randrange(296), rnd.randrange(128)
+        draw.rectangle((x, y, x + rnd.randrange(30), y + rnd.randrange(30)), fill=rnd.choice(["black", "white"]))
+    vertical = horizontal.rotate(90, expand=True)
+    return {"horizontal": horizontal, "vertical": vertical}
+
+
+def timeit(func, image, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(image)
+    return (time.perf_counter() - start) / repeat
+
+
+def main(repeat=20):
+    for name, image in sample_images().items():
+        if bytes(framebuffer.pack(image)) != bytes(framebuffer.pack_reference(image)):
+            raise AssertionError(f"{name}: 打包结果不一致")
+        old = timeit(framebuffer.pack_reference, image, max(1, repeat // 10))
+        new = timeit(framebuffer.pack, image, repeat)
+        print(f"{name:<10} reference: {old * 1000:8.2f}ms  pack: {new * 1000:8.3f}ms  x{old / new:.0f}")
+
+
+if __name__ == "__main__":
+    main()
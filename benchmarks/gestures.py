@@ -0,0 +1,37 @@
+# 手势识别检查：抬起的位置参与分类，在仓库根目录运行：python3 -m benchmarks.gestures
+import sys
+
+from enviroment.touchscreen.gestures import Recognizer
+
+
+def run(samples):  # samples: [(秒, 是否按下, x, y), ...]，返回抬起时识别出的手势
+    recognizer = Recognizer()
+    gesture = None
+    for moment, touch, x, y in samples:
+        gesture = recognizer.feed(moment, touch, x, y)
+    return gesture
+
+
+CASES = (
+    # (名称, 采样, 手势, slide("x"))
+    ("tap", [(0, True, 10, 10), (0.05, False, 12, 10)], "tap", 0),
+    ("down-up far apart", [(0, True, 10, 10), (0.05, False, 100, 10)], "fling", 90),
+    ("slow down-up far apart", [(0, True, 10, 10), (0.5, False, 100, 10)], "swipe", 90),
+    ("small moves then far release", [(0, True, 10, 10), (0.02, True, 13, 10), (0.04, True, 15, 10),
+                                      (0.3, False, 85, 10)], "swipe", 75),
+    ("short flick", [(0, True, 10, 10), (0.01, True, 16, 10), (0.02, False, 21, 10)], "fling", 0),
+)
+
+
+def main():
+    failed = 0
+    for name, samples, kind, slide in CASES:
+        gesture = run(samples)
+        ok = gesture.kind == kind and gesture.slide("x") == slide
+        failed += not ok
+        print(f"{name}: {gesture.kind} slide {gesture.slide('x')} {'ok' if ok else f'expected {kind} slide {slide}'}")
+    return not failed
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
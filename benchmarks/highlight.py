@@ -0,0 +1,71 @@
+# 按下反馈的恢复检查：按下、移开、抬起后屏幕的buffer应回到页面的画面，在仓库根目录运行：python3 -m benchmarks.highlight
+import sys
+import time
+
+import enviroment
+from enviroment.drivers import framebuffer
+from enviroment.touchscreen import Clicked
+
+import main as _main
+
+
+def settle(env, simulator, timeout=5):  # 等待没有待显示的画面，并等到最后一次刷新结束
+    env.Compositor.flush(timeout)
+    env.Display.flush(timeout)
+    time.sleep(1)
+    simulator.wait_busy()
+
+
+def restored(env, simulator) -> bool:  # 屏幕上是否是最近一次提交的画面
+    return simulator._last_buffer == framebuffer.pack(env.last_frame, reversed=simulator.reversed)
+
+
+def buttons(env) -> list:  # 当前页面中显示按下反馈的区域
+    return [i.area for index in env.Now.touch_sources for i in index
+            if isinstance(i, Clicked) and i.highlight]
+
+
+def drag_off(env, simulator):  # 全局刷新进行中按下一行，移出这一行后抬起，移动距离不构成滑动
+    x0, x1, y0, y1 = buttons(env)[0]
+    x, y = (x0 + x1) // 2, y1 - 3
+    env.display(refresh="t")
+    time.sleep(0.2)
+    simulator.touch(x, y)
+    time.sleep(0.1)
+    simulator.touch(x, y + 15)
+    simulator.touch(x, y + 15, False)
+    settle(env, simulator)
+    return restored(env, simulator)
+
+
+def overlapping(env, simulator):  # 前一个按钮恢复之前又按下另一个
+    first, second = buttons(env)[:2]
+    env.Display.invert(first)
+    env.Display.invert(second)
+    settle(env, simulator)
+    env.Display.invert(first, True)
+    env.Display.invert(second, True)
+    settle(env, simulator)
+    return restored(env, simulator)
+
+
+def main(app="设置"):
+    simulator = enviroment.Headless(latency=enviroment.Headless.PANEL_LATENCY)
+    env = enviroment.Env(simulator)
+    _main.env = env  # main_thread使用main模块中的env
+    env.Pool.add(_main.main_thread)
+    env.Pool.add(simulator.start, env)
+    while env.Now is None:
+        time.sleep(0.1)
+    env.open_app(app)
+    settle(env, simulator)
+    results = {"drag_off": drag_off(env, simulator), "overlapping": overlapping(env, simulator)}
+    for name, result in results.items():
+        print(f"{name}: {'restored' if result else 'NOT restored'}")
+    print(f"inverted: {env.Display.inverted}")
+    simulator.quit()
+    return all(results.values())
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
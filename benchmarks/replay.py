@@ -0,0 +1,31 @@
+# 回放main.py --record录制的会话并与录制的画面比较，在仓库根目录运行：python3 -m benchmarks.replay session.rec
+import sys
+
+import enviroment
+from enviroment import recorder
+
+import main as _main
+
+
+def main(path, settle=0.5):
+    expected = list(recorder.read(path))
+    simulator = enviroment.Headless(latency=enviroment.Headless.PANEL_LATENCY)
+    env = enviroment.Env(simulator)
+    _main.env = env  # main_thread使用main模块中的env
+    env.Pool.add(_main.main_thread)
+    env.Pool.add(simulator.start, env)
+    actual = recorder.replay(env, expected, settle)
+    result = recorder.compare(expected, actual)
+    print(f"frames: {result['matched']}/{result['expected']} matched, {result['actual']} replayed")
+    if result["missing"]:
+        print(f"missing frames: {result['missing']}")
+    if result["delays"]:
+        delays = result["delays"]
+        print(f"delay: mean {sum(delays) / len(delays) * 1000:.1f}ms, max {max(delays) * 1000:.1f}ms")
+    simulator.quit()
+    return result
+
+
+if __name__ == "__main__":
+    result = main(sys.argv[1])
+    sys.exit(0 if result["matched"] == result["expected"] else 1)
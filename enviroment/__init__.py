@@ -1,28 +1,41 @@
 import threading as _threading
 import time as _time
 from queue import LifoQueue as _LifoQueue
+from collections import deque as _deque
 
-# 模拟器GUI wxpython
-import wx as _wx
+# 模拟器GUI wxpython，只使用Headless时可以不安装
+try:
+    import wx as _wx
+except ImportError:
+    _wx = None
 
 from PIL import Image as _Image, \
-    ImageFont as _ImageFont, \
-    ImageDraw as _ImageDraw
+    ImageFont as _ImageFont
 
 from system import threadpool as _threadpool
 from system import logger as _logger
 from system import configurator as _configurator
 from system import api as _api
+from system import tracing as _tracing
 from .touchscreen import Clicked as _Clicked, \
     SlideY as _SlideY, \
     TouchHandler as _TouchHandler, \
     TouchRecoder as _TouchRecoder
+from .touchscreen.index import TouchIndex as _TouchIndex
 from .touchscreen.events import SlideX as _SlideX, Clicked as _Clicked
 import os as _os
 from framework import struct as _struct
 from framework import lib as _lib
+from framework import text as _text
+from framework import overlay as _overlay
 
-from enviroment.drivers import taptic as _taptic, bluetooth_server as _bluetooth
+from enviroment.drivers import taptic as _taptic, bluetooth_server as _bluetooth, framebuffer as _framebuffer, \
+    refresh as _refresh
+from enviroment.drivers.async_display import AsyncDisplay as _AsyncDisplay
+from enviroment.headless import Headless
+from enviroment.compositor import Compositor as _Compositor
+from enviroment import recorder as _recorder
+from enviroment.power import PowerManager as _PowerManager
 
 example_config = {
     "theme": "默认（黑）",
@@ -64,13 +77,17 @@ class Notice:
 
 # 模拟器屏幕
 class Simulator:
-    def __init__(self):
+    TITLE = "水墨屏模拟器 v2.0 by xuanzhi33"
+
+    def __init__(self, stats=False):
+        if _wx is None:
+            raise RuntimeError("模拟器需要wxPython，没有图形界面时请使用Headless")
         self.env = None
         self.touch_recoder_dev = _TouchRecoder()
         self.touch_recoder_old = _TouchRecoder()
         self.app = _wx.App()
         # 创建窗口(296x128)
-        self.frame = _wx.Frame(None, title="水墨屏模拟器 v2.0 by xuanzhi33", size=(296, 155))
+        self.frame = _wx.Frame(None, title=self.TITLE, size=(296, 155))
         self.frame.SetMaxSize((296, 155))
         self.frame.SetMinSize((296, 155))
 
@@ -78,6 +95,29 @@ class Simulator:
 
         self.touched = False
 
+        self._last_buffer = None
+        self._tracked = False
+        self.last_region = None  # 与硬件Screen相同，记录每次刷新的区域
+        self.policy = _refresh.RefreshPolicy()  # 与硬件Screen相同的自动刷新策略
+        self.reversed = False  # 与硬件Screen相同，屏幕倒置时在打包buffer时旋转180°
+        self.asleep = False  # 与硬件Screen相同，sleep后下一次显示时唤醒
+
+        # 只有一格的画面信箱，由wx.CallAfter在GUI线程中取出，来不及显示的旧画面直接丢弃
+        self._mailbox = None
+        self._mailbox_lock = _threading.Lock()
+        self._bitmap = None  # 复用的位图，画面尺寸不变时直接拷贝像素
+
+        # 计数器，stats为True时在标题栏显示帧率和从提交到显示的延迟
+        self.stats = stats
+        self.shown = 0
+        self.dropped = 0
+        self.latency = 0  # 最近一帧的延迟(秒)
+        self._shown_times = _deque(maxlen=30)
+        self.merged = 0  # 因超过Env.touch_sample_rate而没有送出的移动事件
+        self._last_move = 0
+        self._last_image = None
+        self._highlights = []  # 与硬件Screen相同，正在反色显示的区域
+
     def start(self, env):
         self.env = env
 
@@ -99,6 +139,12 @@ class Simulator:
 
     def on_move(self, event):
         if self.touched:
+            now = _time.perf_counter()
+            rate = self.env.touch_sample_rate
+            if rate and now - self._last_move < 1 / rate:  # 跳过的位置由下一次移动或抬起代替
+                self.merged += 1
+                return
+            self._last_move = now
             x = event.GetX()
             y = event.GetY()
             self.touch_recoder_old.Touch = True
@@ -127,22 +173,93 @@ class Simulator:
         self.touch_recoder_dev.Y[0] = y
         self.env.TouchHandler.handle(self.touch_recoder_dev, self.touch_recoder_old)
 
-    def updateImage(self, image: _Image):
-        def bitmapThreading():
-            wximg = _wx.Image(296, 128, image.convert("RGB").tobytes())
-            bmp = _wx.Bitmap(wximg)
-            self.static_bit.SetBitmap(bmp)
-
-        _threading.Thread(target=bitmapThreading).start()
+    def updateImage(self, image: _Image):  # 可在任意线程中调用，不等待显示
+        self._last_image = image
+        with self._mailbox_lock:
+            scheduled = self._mailbox is not None
+            if scheduled:
+                self.dropped += 1
+            self._mailbox = (image, _time.perf_counter())
+        if not scheduled:
+            _wx.CallAfter(self._show)
+
+    def _show(self):  # 在GUI线程中调用
+        with self._mailbox_lock:
+            if self._mailbox is None:
+                return
+            (image, submitted), self._mailbox = self._mailbox, None
+        if self.reversed:  # 硬件上在buffer中旋转，模拟器只需要预览
+            image = image.rotate(180)
+        data = image.convert("RGB").tobytes()
+        if self._bitmap is None or self._bitmap.GetSize() != image.size:
+            self._bitmap = _wx.Bitmap.FromBuffer(image.width, image.height, data)
+        else:
+            self._bitmap.CopyFromBuffer(data, _wx.BitmapBufferFormat_RGB)
+        self.static_bit.SetBitmap(self._bitmap)
+
+        now = _time.perf_counter()
+        self.shown += 1
+        self.latency = now - submitted
+        self._shown_times.append(now)
+        if self.stats:
+            span = now - self._shown_times[0]
+            fps = (len(self._shown_times) - 1) / span if span else 0
+            self.frame.SetTitle(f"{self.TITLE}  {fps:.1f}fps {self.latency * 1000:.0f}ms 丢弃{self.dropped}")
+
+    def _pack(self, image: _Image):
+        with _tracing.stage("convert"):
+            return _framebuffer.pack(image, reversed=self.reversed)
+
+    def _diff(self, image: _Image, full=False, buffer=None):  # buffer为已经打包好的image
+        self.asleep = False
+        self._highlights.clear()
+        if buffer is None:
+            buffer = self._pack(image)
+        self.last_region = _framebuffer.diff_region(None if full else self._last_buffer, buffer)
+        self._last_buffer = buffer
+        return self.last_region
 
     def display(self, image: _Image):
+        self._diff(image, True)
+        self._tracked = False  # 直接调用display的画面不在Env的脏矩形跟踪范围内
+        self.policy.full_done()
         self.updateImage(image)
 
-    def display_partial(self, image: _Image):
-        self.updateImage(image)
+    def display_partial(self, image: _Image, damage=None):
+        if damage == [] and self._tracked:  # 页面没有变化
+            self.last_region = None
+            return
+        self._tracked = True
+        if self._diff(image):
+            self.updateImage(image)
 
-    def display_auto(self, image: _Image):
-        self.updateImage(image)
+    def display_auto(self, image: _Image, damage=None):
+        if damage == [] and self._tracked:
+            self.last_region = None
+            return
+        buffer = self._pack(image)
+        self._tracked = True
+        if self.policy.choose(self._last_buffer, buffer) == "t":
+            self._diff(image, True, buffer)
+            self.updateImage(image)
+        elif self._diff(image, buffer=buffer):
+            self.updateImage(image)
+
+    def invert(self, box, revert=False):  # 与硬件Screen相同的按下反馈
+        if self.asleep or self._last_buffer is None or self._last_image is None:
+            return
+        if (box in self._highlights) != revert:
+            return
+        if revert:
+            self._highlights.remove(box)
+        else:
+            self._highlights.append(box)
+        self._last_buffer = _framebuffer.invert(self._last_buffer, box, self.reversed)
+        self._tracked = False
+        self.updateImage(_framebuffer.invert_image(self._last_image, box))
+
+    def sleep(self):
+        self.asleep = True
 
     def wait_busy(self):
         pass
@@ -242,8 +359,11 @@ class _SystemBook(_struct.Book):
         self.add_page("choice", _ChoicePage(self))
         self.notice_img = env.notice_img
         self.notice_alpha = env.notice_alpha
+        self.overlays = _overlay.OverlayCache(4, mode="L" if env.mono else "RGBA")  # 通知横幅，按通知缓存，通知被移除时清空
+        self._page_layer = (None, None)  # (页面上一次的渲染结果, 对应的Layer)
         self.notice_touch_records_clicked = [_Clicked((0, 296, 0, 36), self.env.notice_handler, True),
                                              _Clicked((0, 296, 36, 128), self.env.notice_handler, False)]
+        self._notice_index = _TouchIndex(self.notice_touch_records_clicked)
         self._active = True
 
     @property
@@ -269,6 +389,14 @@ class _SystemBook(_struct.Book):
     def touch_records_slide_y(self):
         return self.Page.touch_records_slide_y
 
+    @property
+    def touch_sources(self) -> tuple:  # 有通知时只响应通知横幅，不响应被遮住的对话框页面
+        if self.env.events_stack:
+            return self.Page.touch_index,
+        elif self.env.notices:
+            return self._notice_index,
+        return ()
+
     def set(self):
         if self.env.events_stack:
             handling = self.env.events_stack[-1]
@@ -279,36 +407,45 @@ class _SystemBook(_struct.Book):
                 self.change_page("prompt", False, False)
                 self.Page.set(handling.title, handling.text, handling.icon)
 
+    def _build_notice(self, builder, handling):
+        builder.paste(self.notice_img, mask=self.notice_alpha)
+        if handling.icon:
+            builder.paste(handling.icon, (10, 9))
+            builder.text((34, 10), handling.text, "black", self.env.get_font(16))
+        else:
+            builder.text((10, 10), handling.text, "black", self.env.get_font(16))
+
+    def _page_overlay(self):  # 对话框页面没有变化时复用上一次的蒙版
+        image = self.Page.render()
+        if self._page_layer[0] is not self.Page.old_render:
+            mask = image.getchannel("A")
+            if self.env.mono:
+                image = image.convert("L")
+            self._page_layer = (self.Page.old_render, _overlay.Layer(image, mask, (0, 0)))
+        return self._page_layer[1]
+
+    def apply(self, image) -> bool:  # 把系统层叠加到image上，没有需要显示的内容时返回False
+        if not self.take_over:
+            return False
+        if self.env.notices:
+            handling = self.env.notices[-1]
+            self.overlays.get(id(handling), self._build_notice, handling).apply(image)
+        if self.env.events_stack:
+            self._page_overlay().apply(image)
+        return True
+
     def render(self):
         if self.take_over:
-            if self.env.notices:
-                handling = self.env.notices[-1]
-                image = self.notice_img.copy()
-                draw = _ImageDraw.Draw(image)
-                if handling.icon:
-                    image.paste(handling.icon, (10, 9))
-                    draw.text((34, 10), handling.text, "black", font=self.get_font(16))
-                else:
-                    draw.text((10, 10), handling.text, "black", font=self.get_font(16))
-
-                page_img = self.Page.render()
-                (_, _, _, a) = page_img.split()
-                image.paste(self.Page.render, mask=a)
-
-                return image
-            return self.Page.render()
+            image = _Image.new("RGBA", (296, 128), (255, 255, 255, 0))
+            self.apply(image)
+            return image
 
-    def display(self, refresh="a") -> None:
+    def display(self, refresh="a") -> None:  # 系统层由Env._compose在Compositor线程中叠加
         if self.take_over:
-            self.env.display(self.render(), refresh=refresh)
+            self.env.display(refresh=refresh)
 
     def update(self, page, refresh="a"):
-        if self.take_over:
-            now_image = self.env.Now.render()
-            self_image = self.render()
-            (_, _, _, a) = self_image.split()
-            now_image.paste(self_image, mask=a)
-            self.env.display(now_image, refresh=refresh)
+        self.display(refresh)
 
     def __getattr__(self, _):
         return self
@@ -340,20 +477,38 @@ class Env:
         # logger
         self.Logger = _logger.Logger(0)
 
-        # locks
-        self.display_lock = _threading.Lock()
-
         # fonts
         self.fonts = {}
 
         # screen
         self.Screen = simulator
         self.screen_reversed = self.Config.read("screen_reversed")
+        self.Screen.reversed = self.screen_reversed  # 旋转在屏幕打包buffer时完成，见framebuffer.rotate_180
+        # 单色流水线：页面在L/LA下合成，交给屏幕的画面为"1"。不放进example_config，以免旧的配置文件被判定为失效
+        self.mono = self.Config.read_or_create("mono", False)
+        # 自动刷新的残影预算，见drivers.refresh.RefreshPolicy
+        self.Screen.policy.ghost_budget = self.Config.read_or_create("ghosting_budget",
+                                                                     self.Screen.policy.ghost_budget)
+
+        # 会话录制，见start_recording
+        self.Recorder = None
 
         # threadpool
         self.Pool = _threadpool.ThreadPool(20, self.Logger.warn)
         self.Pool.start()
 
+        # 异步显示，画面提交后立即返回，屏幕忙碌期间只保留最新的一帧
+        self.Display = _AsyncDisplay(self.Screen, self.Logger.error)
+
+        # compositor，所有的渲染和显示都在这个线程中完成
+        self.Compositor = _Compositor(self._compose, self._push, handler=self.Logger.error)
+        self.Compositor.start()
+
+        # 电源管理，空闲一段时间后屏幕深度睡眠，见enviroment.power
+        self.Power = _PowerManager(self, self.Config.read_or_create("idle_timeout", 60), self.Logger.error)
+        self.Display.on_wake = self.Power.woken
+        self.Power.start()
+
         """
         
         # touchscreen
@@ -365,7 +520,20 @@ class Env:
         # taptic
         self.Taptic = _taptic.TapticEngine()
 
+        # 移动事件的采样上限(次/秒)，模拟器和硬件触摸采集都按它合并过密的移动，为0时不限制
+        self.touch_sample_rate = self.Config.read_or_create("touch_sample_rate", 60)
+
+        # 按下带highlight的Clicked时立即反色显示它的区域，见TouchHandler和AsyncDisplay.invert
+        self.press_highlight = self.Config.read_or_create("press_highlight", True)
+
+        # 触摸到屏幕刷新的延迟追踪，见system.tracing
+        self.Tracer = _tracing.tracer
+        self._latency_ticks = 0
+        self.Power.add_tick(self._log_latency)
+
+        # 触摸分发线程，handle只把采样放入队列
         self.TouchHandler = _TouchHandler(self)
+        self.TouchHandler.start()
 
         # bluetooth
         self.Bluetooth = _bluetooth.Bluetooth(self.Pool, self.Logger)
@@ -396,6 +564,9 @@ class Env:
         self._update_temp = False
         self._home_bar = False
         self._home_bar_temp = 0
+        self._last_source = None
+        self.damage = None  # 上一帧的脏矩形，见struct.Page.render
+        self.last_frame = None  # 最近一次提交显示的整帧(含系统层，mono时为"1")，还没有显示过画面时为None
 
         # images
         self.none18px_img = _Image.open("resources/images/None18px.jpg")
@@ -427,6 +598,9 @@ class Env:
         self.next_img = _Image.open("resources/images/next.png").convert("RGBA")
         self.next_alpha = self.next_img.split()[3]
 
+        # 返回箭头和home bar的覆盖层，按(左, 右, home bar)的显示状态缓存
+        self.overlays = _overlay.OverlayCache(8, mode="L" if self.mono else "RGBA")
+
         # event
         self.system_book = _SystemBook(self)
         self.events_stack = []
@@ -494,6 +668,20 @@ class Env:
             self.notice(text)
             return {"status": 1}
 
+        @self.API.get_api("latency")
+        def latency(_, __):
+            return {"status": 1, "latency": self.Tracer.report, "compositor": self.Compositor.counters,
+                    "display": {"submitted": self.Display.submitted, "replaced": self.Display.replaced,
+                                "displayed": self.Display.displayed, "inverted": self.Display.inverted},
+                    "policy": self.Screen.policy.report, "power": self.Power.report,
+                    "touch": {"dropped": self.TouchHandler.dropped, "coalesced": self.TouchHandler.coalesced,
+                              "merged": getattr(self.Screen, "merged", 0)}}
+
+        @self.API.post_api("latency_reset")
+        def latency_reset(_, __):
+            self.Tracer.reset()
+            return {"status": 1}
+
         @self.API.post_api("prompt")
         def prompt(args, _):
             try:
@@ -531,87 +719,111 @@ class Env:
 
     def display(self, image=None, refresh="a"):
         if image:
-            self.Screen.wait_busy()
-            if refresh == "a":
-                self.Screen.display_auto(image)
-            elif refresh == "t":
-                self.Screen.display(image)
-            elif refresh == "f":
-                self.Screen.display_partial(image)
-
-        elif self.display_lock.acquire(blocking=False):
-            self.Screen.wait_busy()
-            image = self.Now.render()
-            self.display_lock.release()
-            self._update_temp = False
-
-            self.system_book.set()
-            add_image = self.system_book.render()
-            if add_image:
-                (_, _, _, a) = add_image.split()
-                image.paste(add_image, mask=a)
-            # draw = _ImageDraw.ImageDraw(image)
-            # if self.events_stack:
-            #     handling = self.events_stack[-1]
-            #     if isinstance(handling, Choice):
-            #         image.paste(self.choice_img, mask=self.choice_alpha)
-            #         self._multiple_text.set_size((174, 30))
-            #         self._label_left.set_text(handling.false_text)
-            #         temp = self._label_left.render()
-            #         a = temp.split()[3]
-            #         image.paste(temp, (61, 86), mask=a)
-            #         self._label_right.set_text(handling.true_text)
-            #         temp = self._label_right.render()
-            #         a = temp.split()[3]
-            #         image.paste(temp, (148, 86), mask=a)
-            #     else:
-            #         image.paste(self.prompt_img, mask=self.prompt_alpha)
-            #         self._multiple_text.set_size((174, 48))
-            #     if handling.icon:
-            #         image.paste(handling.icon, (65, 32))
-            #         draw.text((88, 34), handling.title, "black", font=self.get_font(16))
-            #     else:
-            #         draw.text((65, 34), handling.title, "black", font=self.get_font(16))
-            #     self._multiple_text.set_text(handling.text)
-            #     temp = self._multiple_text.render()
-            #     a = temp.split()[3]
-            #     image.paste(self._multiple_text.render(), (61, 53), mask=a)
-            # 
-            # if self.notices:
-            #     handling = self.notices[-1]
-            #     image.paste(self.notice_img, (0, 0), mask=self.notice_alpha)
-            #     if handling.icon:
-            #         image.paste(handling.icon, (10, 9))
-            #         draw.text((34, 10), handling.text, "black", font=self.get_font(16))
-            #     else:
-            #         draw.text((10, 10), handling.text, "black", font=self.get_font(16))
-
-            if self.show_left_back:
-                image.paste(self.left_img, mask=self.left_img_alpha)
-            if self.show_right_back:
-                image.paste(self.right_img, mask=self.right_img_alpha)
-            if self._home_bar:
-                image.paste(self.bar_img, mask=self.bar_img_alpha)
-
-            if self.screen_reversed:
-                image = image.rotate(180)
-
-            if refresh == "a":
-                self.Screen.display_auto(image)
-            elif refresh == "t":
-                self.Screen.display(image)
-            elif refresh == "f":
-                self.Screen.display_partial(image)
+            self._last_source = None
+            self.Compositor.request(refresh, image)
+        else:
+            self.Compositor.request(refresh)
+
+    def _compose(self):  # 在Compositor线程中调用，渲染当前页面并叠加系统层
+        image = self.Now.render()
+        damage = self.Now.damage
+        self._update_temp = False
+        if self.mono and image.mode != "L":  # 整帧不需要透明度
+            image = image.convert("L")
+
+        self.system_book.set()
+        system = self.system_book.apply(image)
+
+        # 只有画面来源和覆盖层都与上一帧相同时，页面的脏矩形才能代表整帧的变化
+        overlays = (self.show_left_back, self.show_right_back, self._home_bar, system)
+        source = (self.Now.Book.Page, self.screen_reversed) + overlays
+        if source != self._last_source or any(overlays):
+            damage = None
+        self._last_source = source
+        self.damage = damage
+        # draw = _ImageDraw.ImageDraw(image)
+        # if self.events_stack:
+        #     handling = self.events_stack[-1]
+        #     if isinstance(handling, Choice):
+        #         image.paste(self.choice_img, mask=self.choice_alpha)
+        #         self._multiple_text.set_size((174, 30))
+        #         self._label_left.set_text(handling.false_text)
+        #         temp = self._label_left.render()
+        #         a = temp.split()[3]
+        #         image.paste(temp, (61, 86), mask=a)
+        #         self._label_right.set_text(handling.true_text)
+        #         temp = self._label_right.render()
+        #         a = temp.split()[3]
+        #         image.paste(temp, (148, 86), mask=a)
+        #     else:
+        #         image.paste(self.prompt_img, mask=self.prompt_alpha)
+        #         self._multiple_text.set_size((174, 48))
+        #     if handling.icon:
+        #         image.paste(handling.icon, (65, 32))
+        #         draw.text((88, 34), handling.title, "black", font=self.get_font(16))
+        #     else:
+        #         draw.text((65, 34), handling.title, "black", font=self.get_font(16))
+        #     self._multiple_text.set_text(handling.text)
+        #     temp = self._multiple_text.render()
+        #     a = temp.split()[3]
+        #     image.paste(self._multiple_text.render(), (61, 53), mask=a)
+        # 
+        # if self.notices:
+        #     handling = self.notices[-1]
+        #     image.paste(self.notice_img, (0, 0), mask=self.notice_alpha)
+        #     if handling.icon:
+        #         image.paste(handling.icon, (10, 9))
+        #         draw.text((34, 10), handling.text, "black", font=self.get_font(16))
+        #     else:
+        #         draw.text((10, 10), handling.text, "black", font=self.get_font(16))
+
+        if any(overlays[:3]):
+            self.overlays.get(overlays[:3], self._build_navigation, *overlays[:3]).apply(image)
+
+        if self.mono:
+            image = image.convert("1")
+        return image, damage
+
+    def _build_navigation(self, builder, left, right, bar):
+        if left:
+            builder.paste(self.left_img, mask=self.left_img_alpha)
+        if right:
+            builder.paste(self.right_img, mask=self.right_img_alpha)
+        if bar:
+            builder.paste(self.bar_img, mask=self.bar_img_alpha)
+
+    def _push(self, image, damage, refresh):  # 在Compositor线程中调用，不等待屏幕刷新
+        recorder = self.Recorder
+        if recorder:
+            recorder.frame(image, refresh)
+        self.last_frame = image
+        self.Display.submit(image, refresh, damage)
+
+    def _log_latency(self):  # 每10分钟把触摸延迟的摘要写入日志
+        self._latency_ticks += 1
+        if self._latency_ticks % 10 == 0 and self.Tracer.started:
+            self.Logger.info(self.Tracer.summary())
+
+    def start_recording(self, target):  # 录制触摸和画面到target(路径或二进制文件对象)，见enviroment.recorder
+        self.stop_recording()
+        self.Recorder = _recorder.Recorder(target)
+
+    def stop_recording(self):
+        recorder, self.Recorder = self.Recorder, None
+        if recorder:
+            recorder.close()
 
     def get_font(self, size=12):
         if size in self.fonts:
             return self.fonts[size]
         elif not size % 12:
-            self.fonts[size] = _ImageFont.truetype("resources/fonts/VonwaonBitmap-12px.ttf", size)
+            font = _ImageFont.truetype("resources/fonts/VonwaonBitmap-12px.ttf", size)
         elif not size % 16:
-            self.fonts[size] = _ImageFont.truetype("resources/fonts/VonwaonBitmap-16px.ttf", size)
+            font = _ImageFont.truetype("resources/fonts/VonwaonBitmap-16px.ttf", size)
         else:
             raise ValueError("It can only be a multiple of 12 or 16.")
+        # 点阵字体在整数倍大小下没有抗锯齿，可以使用字形缓存
+        self.fonts[size] = _text.atlas.register(font)
         return self.fonts[size]
 
     def back_home(self) -> bool:
@@ -619,6 +831,7 @@ class Env:
         flag = False
         if self.notices:
             self.notices = []
+            self.system_book.overlays.invalidate()
             flag = True
         while self.events_stack:
             self.close_event()
@@ -720,6 +933,13 @@ class Env:
         for i in self.themes.values():
             self.Pool.add(i.shutdown)
         _time.sleep(2)
+        self.Power.stop(1)
+        if self.Tracer.started:
+            self.Logger.info(self.Tracer.summary())
+        self.TouchHandler.stop(1)
+        self.Compositor.stop(1)
+        self.Display.stop(5)
+        self.stop_recording()
         self.Screen.quit()
 
     def start(self):
@@ -734,13 +954,13 @@ class Env:
 
     def poweroff(self):
         self.Logger.info("关机")
-        self.Screen.display(_Image.open("resources/images/raspberry.jpg"))
+        self.Display.submit(_Image.open("resources/images/raspberry.jpg"), "t").wait(10)
         self.quit()
         _os.system("sudo poweroff")
 
     def reboot(self):
         self.Logger.info("重启")
-        self.Screen.display(_Image.open("resources/images/raspberry.jpg"))
+        self.Display.submit(_Image.open("resources/images/raspberry.jpg"), "t").wait(10)
         self.quit()
         _os.system("sudo reboot")
 
@@ -748,7 +968,7 @@ class Env:
     def clean_logs():
         _os.system("rm -f logs/*")
 
-    def screenshot(self):
+    def screenshot(self):  # 渲染当前页面，不含系统层；屏幕上最近一次显示的整帧见self.last_frame
         return self.Now.Book.render()
 
     # def _touch_setter(self):
@@ -792,6 +1012,7 @@ class Env:
         if op:
             func = self.notices[-1].func
             del self.notices[-1]
+            self.system_book.overlays.invalidate()
             self._update_temp = True
             # self._touch_setter()
             func()
@@ -799,6 +1020,7 @@ class Env:
                 self.display()
         else:
             del self.notices[-1]
+            self.system_book.overlays.invalidate()
             # self._touch_setter()
             self.display()
 
@@ -880,6 +1102,7 @@ class Env:
     def screen_reverse(self):
         self.screen_reversed = not self.screen_reversed
         self.Config.set("screen_reversed", self.screen_reversed)
+        self.Screen.reversed = self.screen_reversed
         self.display(refresh="t")
 
     def change_theme(self, name):
@@ -0,0 +1,117 @@
+# 渲染/显示调度线程
+import threading as _threading
+import time as _time
+import traceback as _traceback
+
+from system import tracing as _tracing
+
+_PRIORITY = {"f": 1, "a": 2, "t": 3}  # 合并请求时取最强的刷新方式
+
+
+def merge_refresh(old, new):  # 合并两次请求的刷新方式，old为None表示还没有请求
+    if old is None or _PRIORITY.get(new, 0) > _PRIORITY.get(old, 0):
+        return new
+    return old
+
+
+class Compositor:
+    """
+    唯一的渲染/显示线程
+    request只记录"脏"并唤醒线程，线程等待一个帧窗口，把窗口内的请求合并为一帧，渲染最新的状态后推送到屏幕。
+    请求不会因为正在显示而被丢弃，连续的多次请求也只会渲染一次
+    """
+
+    def __init__(self, render, push, window=0.05, handler=None):
+        self._render = render  # render() -> (image, damage)
+        self._push = push  # push(image, damage, refresh)
+        self.window = window
+        self._handler = handler if handler else print
+
+        self._lock = _threading.Lock()
+        self._event = _threading.Event()
+        self._idle = _threading.Event()
+        self._idle.set()
+        self._pending = False
+        self._refresh = None
+        self._image = None
+        self._traces = {}  # 这一帧包含的追踪 -> 第一次请求的时间
+        self.running = False
+        self._thread = None
+
+        # 计数器
+        self.requested = 0  # 收到的请求
+        self.coalesced = 0  # 被合并到已有请求中的请求
+        self.rendered = 0  # 实际渲染的帧
+        self.pushed = 0  # 实际推送到屏幕的帧
+
+    @property
+    def counters(self) -> dict:
+        return {"requested": self.requested, "coalesced": self.coalesced,
+                "rendered": self.rendered, "pushed": self.pushed}
+
+    def start(self):
+        self.running = True
+        self._thread = _threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self.running = False
+        self._event.set()
+        if self._thread and self._thread is not _threading.current_thread():
+            self._thread.join(timeout)
+
+    def request(self, refresh="a", image=None):
+        """
+        请求显示一帧；image为None时渲染当前页面，否则直接显示image。较新的请求覆盖较旧的画面，刷新方式取最强的一个
+        """
+        traces = _tracing.current()
+        with self._lock:
+            self.requested += 1
+            for trace in traces:
+                self._traces.setdefault(trace, _time.perf_counter())
+            if self._pending:
+                self.coalesced += 1
+                self._refresh = merge_refresh(self._refresh, refresh)
+            else:
+                self._pending = True
+                self._refresh = refresh
+            self._image = image
+            self._idle.clear()
+            self._event.set()
+
+    def flush(self, timeout=None) -> bool:  # 等待已提交的请求全部显示完毕
+        return self._idle.wait(timeout)
+
+    def _run(self):
+        while True:
+            self._event.wait()
+            if not self.running:
+                break
+            _time.sleep(self.window)  # 帧窗口内到达的请求会合并到这一帧
+            with self._lock:
+                self._event.clear()
+                self._pending = False
+                refresh, image = self._refresh, self._image
+                self._image = None
+                traces, self._traces = self._traces, {}
+            now = _time.perf_counter()
+            for trace, moment in traces.items():
+                _tracing.record("compose_wait", now - moment, (trace,))
+            _tracing.activate(traces)  # 推送的画面带上这些追踪，见AsyncDisplay.submit
+            try:
+                if image is None:
+                    with _tracing.stage("render"):
+                        image, damage = self._render()
+                    self.rendered += 1
+                else:
+                    damage = None
+                if refresh in _PRIORITY:
+                    self._push(image, damage, refresh)
+                    self.pushed += 1
+            except Exception:
+                self._handler(_traceback.format_exc())
+            finally:
+                _tracing.activate(())
+                with self._lock:
+                    if not self._pending:
+                        self._idle.set()
@@ -0,0 +1,156 @@
+# 异步显示：submit立即返回，由后台线程等待屏幕空闲后把最新的画面交给屏幕
+import threading
+import time
+import traceback
+
+from enviroment.compositor import merge_refresh
+from system import tracing
+
+
+class DisplayHandle:
+    """
+    submit返回的句柄，画面显示完成、被更新的画面取代或出错后done被set
+    """
+
+    def __init__(self, image, refresh, damage):
+        self.image = image
+        self.refresh = refresh
+        self.damage = damage
+        self.traces = dict.fromkeys(tracing.current(), time.perf_counter())  # 追踪 -> 提交的时间
+        self.done = threading.Event()
+        self.replaced = False  # 在显示之前被更新的画面取代
+        self.error = None
+
+    def wait(self, timeout=None) -> bool:
+        return self.done.wait(timeout)
+
+
+def _merge_damage(old, new):  # 被取代的画面没有显示，新画面的变化范围要包含它的
+    if old is None or new is None:
+        return None
+    return old + new
+
+
+class AsyncDisplay:
+    """
+    包装Screen/Simulator：后台线程等待上一次刷新结束(screen.wait_busy)后再显示下一帧，
+    等待期间只保留最新的一帧，较旧的未显示的帧被取代，刷新方式和脏矩形与之合并
+    """
+
+    def __init__(self, screen, handler=None):
+        self.screen = screen
+        self._handler = handler if handler else print
+        self._lock = threading.Lock()
+        self._screen_lock = threading.Lock()  # 显示线程使用屏幕期间持有，sleep时等待它
+        self._event = threading.Event()
+        self._pending = None
+        self._inverts = []  # 待显示的按下反馈(box, revert)，见invert
+        self._last = None
+        self.on_wake = None  # 画面唤醒了睡眠中的屏幕后在显示线程中调用，见PowerManager.woken
+
+        # 计数器
+        self.submitted = 0
+        self.replaced = 0
+        self.displayed = 0
+        self.inverted = 0  # 显示的按下反馈
+
+        self.running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, image, refresh="a", damage=None) -> DisplayHandle:
+        handle = DisplayHandle(image, refresh, damage)
+        with self._lock:
+            self.submitted += 1
+            old = self._pending
+            if old is not None:
+                handle.refresh = merge_refresh(old.refresh, refresh)
+                handle.damage = _merge_damage(old.damage, damage)
+                handle.traces = {**old.traces, **handle.traces}
+                old.replaced = True
+                old.done.set()
+                self.replaced += 1
+            self._pending = handle
+            self._last = handle
+            self._inverts.clear()  # 新画面会覆盖整个屏幕
+            self._event.set()
+        return handle
+
+    def invert(self, box, revert=False):
+        """
+        按下反馈：在显示线程中按顺序调用screen.invert(box, revert)，不经过Compositor，也不计入延迟追踪。
+        已经有待显示的画面时什么也不做，它会覆盖整个屏幕；恢复一个还没显示的反馈时两者一起取消
+        """
+        with self._lock:
+            if self._pending is not None:
+                return
+            if revert and (box, False) in self._inverts:
+                self._inverts.remove((box, False))
+                return
+            self._inverts.append((box, revert))
+            self._event.set()
+
+    def flush(self, timeout=None) -> bool:  # 等待最后提交的画面显示完成
+        handle = self._last
+        return handle.wait(timeout) if handle else True
+
+    def sleep(self) -> bool:  # 没有待显示的画面时让屏幕进入深度睡眠，下一次显示时屏幕自行重新初始化
+        with self._screen_lock:
+            with self._lock:
+                if self._pending is not None or self._inverts:
+                    return False
+            self.screen.wait_busy()
+            self.screen.sleep()
+        return True
+
+    def stop(self, timeout=None):
+        self.running = False
+        self._event.set()
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            self._event.wait()
+            if not self.running:
+                break
+            with self._screen_lock:
+                self.screen.wait_busy()  # 等待期间到达的新画面会取代旧的
+                with self._lock:
+                    self._event.clear()
+                    handle, self._pending = self._pending, None
+                    inverts, self._inverts = self._inverts, []
+                for index, (box, revert) in enumerate(inverts):
+                    if index:
+                        self.screen.wait_busy()
+                    try:
+                        self.screen.invert(box, revert)
+                        self.inverted += 1
+                    except Exception:
+                        self._handler(traceback.format_exc())
+                if handle is None:
+                    continue
+                now = time.perf_counter()
+                for trace, moment in handle.traces.items():
+                    tracing.record("display_wait", now - moment, (trace,))
+                tracing.activate(handle.traces)
+                try:
+                    asleep = self.screen.asleep
+                    with tracing.stage("refresh"):
+                        if handle.refresh == "t":
+                            self.screen.display(handle.image)
+                        elif handle.refresh == "f":
+                            self.screen.display_partial(handle.image, handle.damage)
+                        else:
+                            self.screen.display_auto(handle.image, handle.damage)
+                    self.displayed += 1
+                    if asleep and self.on_wake:
+                        self.on_wake()
+                    now = time.perf_counter()
+                    for trace in handle.traces:
+                        trace.finish(now)
+                except Exception as e:
+                    handle.error = e
+                    self._handler(traceback.format_exc())
+                finally:
+                    tracing.activate(())
+                    handle.done.set()
@@ -27,14 +27,59 @@
 # THE SOFTWARE.
 #
 # 已被fu1fan修改，勿直接应用于生产环境
-import threading
-import time
 
-from enviroment.drivers import epdconfig
+from enviroment.drivers import epdconfig, framebuffer, refresh
+from system import tracing
 
 # Display resolution
-EPD_WIDTH = 128
-EPD_HEIGHT = 296
+EPD_WIDTH = framebuffer.EPD_WIDTH
+EPD_HEIGHT = framebuffer.EPD_HEIGHT
+
+
+class Sequence:
+    """
+    命令序列：每条命令连同它的数据在一次片选内发出，数据合并为一次SPI写入，代替逐字节的send_data
+    wait()表示在此处等待屏幕空闲；静态的序列在模块加载时生成一次
+    """
+    __slots__ = ("steps",)
+
+    def __init__(self, steps=()):
+        self.steps = list(steps)
+
+    def command(self, command, *data) -> "Sequence":
+        self.steps.append((command, bytes(data)))
+        return self
+
+    def write(self, command, data) -> "Sequence":  # data为bytes/bytearray，用于写入RAM等大块数据
+        self.steps.append((command, data))
+        return self
+
+    def wait(self) -> "Sequence":
+        self.steps.append(None)
+        return self
+
+    def __add__(self, other) -> "Sequence":
+        return Sequence(self.steps + other.steps)
+
+    def run(self, epd):
+        for step in self.steps:
+            if step is None:
+                epd.wait_busy()
+            else:
+                epd.send(*step)
+
+
+def window(x_start, y_start, x_end, y_end) -> Sequence:  # 设置RAM窗口，x必须是8的倍数，否则低3位被忽略
+    return Sequence() \
+        .command(0x44, (x_start >> 3) & 0xFF, (x_end >> 3) & 0xFF) \
+        .command(0x45, y_start & 0xFF, (y_start >> 8) & 0xFF, y_end & 0xFF, (y_end >> 8) & 0xFF)
+
+
+def cursor(x, y) -> Sequence:  # 设置RAM地址计数器
+    return Sequence() \
+        .command(0x4E, (x >> 3) & 0xFF) \
+        .command(0x4F, y & 0xFF, (y >> 8) & 0xFF) \
+        .wait()
 
 
 class Epd2in9V2:
@@ -91,6 +136,28 @@ class Epd2in9V2:
         0x22, 0x17, 0x41, 0xB0, 0x32, 0x36,
     ]
 
+    # 预先生成的静态命令序列
+    LUT_PARTIAL = Sequence().command(0x32, *WF_PARTIAL_2IN9).wait()
+    LUT_PARTIAL_WAIT = Sequence().command(0x32, *WF_PARTIAL_2IN9_Wait).wait()
+    PARTIAL_SETUP = (Sequence()
+                     .command(0x37, 0x00, 0x00, 0x00, 0x00, 0x00, 0x40, 0x00, 0x00, 0x00, 0x00)
+                     .command(0x3C, 0x80)  # BorderWavefrom
+                     .command(0x22, 0xC0)
+                     .command(0x20)
+                     .wait())
+    PARTIAL_PREAMBLE = LUT_PARTIAL + PARTIAL_SETUP  # 每次局部刷新前发送
+    TURN_ON = Sequence().command(0x22, 0xF7).command(0x20).wait()  # DISPLAY_UPDATE_CONTROL_2, MASTER_ACTIVATION
+    TURN_ON_PARTIAL = Sequence().command(0x22, 0x0F).command(0x20)
+    FULL_WINDOW = window(0, 0, EPD_WIDTH - 1, EPD_HEIGHT - 1) + cursor(0, 0)
+    INIT = (Sequence()
+            .command(0x12).wait()  # SWRESET
+            .command(0x01, 0x27, 0x01, 0x00)  # Driver output control
+            .command(0x11, 0x03)  # data entry mode
+            + window(0, 0, EPD_WIDTH - 1, EPD_HEIGHT - 1) +
+            Sequence().command(0x21, 0x00, 0x80)  # Display update control
+            + cursor(0, 0)
+            + Sequence().wait())
+
     # Hardware reset
     def reset(self):  # 不建议进行操作
         epdconfig.digital_write(self.reset_pin, 1)
@@ -101,6 +168,8 @@ class Epd2in9V2:
         epdconfig.delay_ms(20)
 
     def send_command(self, command):  # 不建议进行操作
+        if command in (0x12, 0x20):  # SWRESET, MASTER_ACTIVATION之后屏幕会进入忙碌
+            epdconfig.busy.arm()
         epdconfig.digital_write(self.dc_pin, 0)
         epdconfig.digital_write(self.cs_pin, 0)
         epdconfig.spi_writebyte([command])
@@ -118,63 +187,41 @@ class Epd2in9V2:
         epdconfig.spi_writebyte2(data)
         epdconfig.digital_write(self.cs_pin, 1)
 
-    def wait_busy(self):  # 等待直到屏幕结束忙碌
-        # logging.debug("e-Paper busy")
-        while epdconfig.digital_read(self.busy_pin) == 1:  # 0: idle, 1: busy
-            epdconfig.delay_ms(0.1)
-        # logging.debug("e-Paper busy release")
+    def send(self, command, data=b""):  # 命令和它的数据在同一次片选内发送，数据只需一次SPI写入
+        if command in (0x12, 0x20):
+            epdconfig.busy.arm()
+        epdconfig.digital_write(self.dc_pin, 0)
+        epdconfig.digital_write(self.cs_pin, 0)
+        epdconfig.spi_writebyte([command])
+        if data:
+            epdconfig.digital_write(self.dc_pin, 1)
+            epdconfig.spi_writebyte2(data)
+        epdconfig.digital_write(self.cs_pin, 1)
+
+    def wait_busy(self, timeout=None):  # 等待直到屏幕结束忙碌，见epdconfig.BusySignal
+        return epdconfig.busy.wait(timeout)
 
     def is_busy(self):
-        return epdconfig.digital_read(self.busy_pin)
+        return epdconfig.busy.is_busy()
 
     def turn_on_display(self):  # 不建议进行操作
-        self.send_command(0x22)  # DISPLAY_UPDATE_CONTROL_2
-        self.send_data(0xF7)
-        self.send_command(0x20)  # MASTER_ACTIVATION
-        self.wait_busy()
+        self.TURN_ON.run(self)
 
     def turn_on_display_partial(self):  # 不建议进行操作
-        self.send_command(0x22)  # DISPLAY_UPDATE_CONTROL_2
-        self.send_data(0x0F)
-        self.send_command(0x20)  # MASTER_ACTIVATION
+        self.TURN_ON_PARTIAL.run(self)
         # self.ReadBusy()
 
     def turn_on_display_partial_wait(self):  # 不建议进行操作
-        self.send_command(0x22)  # DISPLAY_UPDATE_CONTROL_2
-        self.send_data(0x0F)
-        self.send_command(0x20)  # MASTER_ACTIVATION
-        self.wait_busy()
+        (self.TURN_ON_PARTIAL + Sequence().wait()).run(self)
 
     def send_lut(self, lut):  # 不建议进行操作
-        self.send_command(0x32)
-        # for i in range(0, 153):
-        # self.send_data(self.WF_PARTIAL_2IN9[i])
-        if lut:
-            self.send_data2(self.WF_PARTIAL_2IN9)
-        else:
-            self.send_data2(self.WF_PARTIAL_2IN9_Wait)
-        self.wait_busy()
+        (self.LUT_PARTIAL if lut else self.LUT_PARTIAL_WAIT).run(self)
 
     def set_window(self, x_start, y_start, x_end, y_end):  # 不建议进行操作
-        self.send_command(0x44)  # SET_RAM_X_ADDRESS_START_END_POSITION
-        # x point must be the multiple of 8 or the last 3 bits will be ignored
-        self.send_data((x_start >> 3) & 0xFF)
-        self.send_data((x_end >> 3) & 0xFF)
-        self.send_command(0x45)  # SET_RAM_Y_ADDRESS_START_END_POSITION
-        self.send_data(y_start & 0xFF)
-        self.send_data((y_start >> 8) & 0xFF)
-        self.send_data(y_end & 0xFF)
-        self.send_data((y_end >> 8) & 0xFF)
+        window(x_start, y_start, x_end, y_end).run(self)
 
     def set_cursor(self, x, y):  # 不建议进行操作
-        self.send_command(0x4E)  # SET_RAM_X_ADDRESS_COUNTER
-        # x point must be the multiple of 8 or the last 3 bits will be ignored
-        self.send_data(x & 0xFF)
-
-        self.send_command(0x4F)  # SET_RAM_Y_ADDRESS_COUNTER
-        self.send_data(y & 0xFF)
-        self.send_data((y >> 8) & 0xFF)
-        self.wait_busy()
+        cursor(x, y).run(self)
 
     def init(self):  # 初始化
         if epdconfig.module_init() != 0:
@@ -183,81 +230,30 @@ class Epd2in9V2:
         self.reset()
 
         self.wait_busy()
-        self.send_command(0x12)  # SWRESET
-        self.wait_busy()
-
-        self.send_command(0x01)  # Driver output control
-        self.send_data(0x27)
-        self.send_data(0x01)
-        self.send_data(0x00)
-
-        self.send_command(0x11)  # data entry mode
-        self.send_data(0x03)
-
-        self.set_window(0, 0, self.width - 1, self.height - 1)
-
-        self.send_command(0x21)  # Display update control
-        self.send_data(0x00)
-        self.send_data(0x80)
-
-        self.set_cursor(0, 0)
-        self.wait_busy()
+        self.INIT.run(self)
         # EPD hardware init end
         return 0
 
-    def get_buffer(self, image):  # 将图片转换为buffer
-        # logging.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width / 8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        # logging.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if imwidth == self.width and imheight == self.height:
-            # logging.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif imwidth == self.height and imheight == self.width:
-            # logging.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy * self.width) / 8)] &= ~(0x80 >> (y % 8))
-        return buf
+    def get_buffer(self, image, reversed=False):  # 将图片转换为buffer，reversed为True时旋转180°
+        with tracing.stage("convert"):
+            return framebuffer.pack(image, self.width, self.height, reversed)
 
     def display(self, image):  # 显示图片
         if image is None:
             return
-        self.send_command(0x24)  # WRITE_RAM
-        # for j in range(0, self.height):
-        # for i in range(0, int(self.width / 8)):
-        # self.send_data(images[i + j * int(self.width / 8)])
-        self.send_data2(image)
-        self.turn_on_display()
+        (self.FULL_WINDOW + Sequence().write(0x24, image) + self.TURN_ON).run(self)  # WRITE_RAM
 
     def display_base(self, image):  # 显示静态底图
         if image is None:
             return
-
-        self.send_command(0x24)  # WRITE_RAM
-        # for j in range(0, self.height):
-        # for i in range(0, int(self.width / 8)):
-        # self.send_data(images[i + j * int(self.width / 8)])
-        self.send_data2(image)
-
-        self.send_command(0x26)  # WRITE_RAM
-        # for j in range(0, self.height):
-        # for i in range(0, int(self.width / 8)):
-        # self.send_data(images[i + j * int(self.width / 8)])
-        self.send_data2(image)
-
-        self.turn_on_display()
-
-    def display_partial(self, image):  # 局部显示
+        # 局部窗口刷新后RAM窗口可能不是全屏，先恢复
+        (self.FULL_WINDOW + Sequence().write(0x24, image).write(0x26, image) + self.TURN_ON).run(self)
+
+    def display_partial(self, image, region=None):  # 局部显示
+        """
+        region: framebuffer.diff_region返回的矩形，只把该区域写入RAM；为None时写入整屏
+        image需与region对应，即framebuffer.crop的结果
+        """
         if image is None:
             return
 
@@ -266,37 +262,19 @@ class Epd2in9V2:
         # epdconfig.digital_write(self.reset_pin, 1)
         # epdconfig.delay_ms(2)
 
-        self.send_lut(1)
-        self.send_command(0x37)
-        self.send_data(0x00)
-        self.send_data(0x00)
-        self.send_data(0x00)
-        self.send_data(0x00)
-        self.send_data(0x00)
-        self.send_data(0x40)
-        self.send_data(0x00)
-        self.send_data(0x00)
-        self.send_data(0x00)
-        self.send_data(0x00)
-
-        self.send_command(0x3C)  # BorderWavefrom
-        self.send_data(0x80)
-
-        self.send_command(0x22)
-        self.send_data(0xC0)
-        self.send_command(0x20)
-        self.wait_busy()
-
-        self.set_window(0, 0, self.width - 1, self.height - 1)
-        self.set_cursor(0, 0)
+        self.partial_sequence(image, region).run(self)
 
-        self.send_command(0x24)  # WRITE_RAM
-        # for j in range(0, self.height):
-        # for i in range(0, int(self.width / 8)):
-        # self.send_data(images[i + j * int(self.width / 8)])
-        self.send_data2(image)
-
-        self.turn_on_display_partial()
+    def partial_sequence(self, image, region=None) -> Sequence:  # display_partial发送的命令序列
+        if region is None:
+            sequence = self.PARTIAL_PREAMBLE + self.FULL_WINDOW
+        else:
+            x_start, y_start, x_end, y_end = region
+            sequence = self.PARTIAL_PREAMBLE + window(x_start << 3, y_start, (x_end << 3) + 7, y_end) + \
+                cursor(x_start << 3, y_start)
+        sequence.write(0x24, image)  # WRITE_RAM
+        if region is not None:
+            sequence += self.FULL_WINDOW
+        return sequence + self.TURN_ON_PARTIAL
 
     def display_partial_wait(self, image):  # 局部显示并等待显示完成
         if image is None:
@@ -307,48 +285,14 @@ class Epd2in9V2:
         epdconfig.digital_write(self.reset_pin, 1)
         # epdconfig.delay_ms(2)
 
-        self.send_lut(0)
-        self.send_command(0x37)
-        self.send_data(0x00)
-        self.send_data(0x00)
-        self.send_data(0x00)
-        self.send_data(0x00)
-        self.send_data(0x00)
-        self.send_data(0x40)
-        self.send_data(0x00)
-        self.send_data(0x00)
-        self.send_data(0x00)
-        self.send_data(0x00)
-
-        self.send_command(0x3C)  # BorderWavefrom
-        self.send_data(0x80)
-
-        self.send_command(0x22)
-        self.send_data(0xC0)
-        self.send_command(0x20)
-        self.wait_busy()
-
-        self.set_window(0, 0, self.width - 1, self.height - 1)
-        self.set_cursor(0, 0)
-
-        self.send_command(0x24)  # WRITE_RAM
-        # for j in range(0, self.height):
-        # for i in range(0, int(self.width / 8)):
-        # self.send_data(images[i + j * int(self.width / 8)])
-        self.send_data2(image)
-
-        self.turn_on_display_partial_wait()
+        (self.LUT_PARTIAL_WAIT + self.PARTIAL_SETUP + self.FULL_WINDOW + Sequence().write(0x24, image) +
+         self.TURN_ON_PARTIAL + Sequence().wait()).run(self)
 
     def clear(self, color):  # 清屏
-        self.send_command(0x24)  # WRITE_RAM
-        for j in range(0, self.height):
-            for i in range(0, int(self.width / 8)):
-                self.send_data(color)
-        self.turn_on_display()
+        (Sequence().write(0x24, bytes([color]) * (self.width // 8 * self.height)) + self.TURN_ON).run(self)
 
     def sleep(self):  # 睡眠模式
-        self.send_command(0x10)  # DEEP_SLEEP_MODE
-        self.send_data(0x01)
+        self.send(0x10, b"\x01")  # DEEP_SLEEP_MODE
 
     @staticmethod
     def exit():  # 退出模块
@@ -362,53 +306,87 @@ class Screen:
         self._driver = Epd2in9V2()
 
         self._driver.init()
-        self._last_display = time.time()
-
-        self.auto_sleep_time = 600  # seconds
-        self._last_display = 0
 
-        self._partial_time = 0  # times
-        self.refresh_time = 60  # times
+        self.policy = refresh.RefreshPolicy()  # display_auto的刷新策略
+        self.reversed = False  # 屏幕倒置，在打包buffer时旋转180°
 
         self._status = True
 
-        self._exit = False
-
-        def auto_sleep_methode():
-            self._last_display = time.time()
-            while 1:
-                time.sleep(self.auto_sleep_time)
-                if self._exit:
-                    return
-                if time.time() - self._last_display >= self.auto_sleep_time:
-                    self._driver.sleep()
-                    self._status = False
-                    self.logger.info("屏幕休眠")
-
-        self.auto_refresh_thread = threading.Thread(target=auto_sleep_methode, daemon=True)
-        self.auto_refresh_thread.start()
-
-    def display_auto(self, image):
-        if self.refresh_time > self._partial_time:
-            self.display_partial(image)
-            self._partial_time += 1
-        else:
+        self._last_buffer = None  # 上一次发送到屏幕的buffer
+        self._tracked = False
+        self.last_region = None  # 上一次刷新的区域，见framebuffer.diff_region
+        self._highlights = []  # 屏幕上正在反色显示的区域，见invert
+
+    @property
+    def asleep(self) -> bool:  # 睡眠由Env.Power通过AsyncDisplay.sleep控制，下一次显示时唤醒
+        return not self._status
+
+    def display_auto(self, image, damage=None):  # 由self.policy决定局部刷新还是全局刷新
+        self._highlights.clear()  # 新画面覆盖按下反馈
+        if not self._status:
             self.display(image)
+            return
+        if damage == [] and self._tracked:  # 页面没有变化
+            self.last_region = None
+            return
+        buffer = self._driver.get_buffer(image, self.reversed)
+        if self.policy.choose(self._last_buffer, buffer) == "t":
+            self._display_full(buffer)
+            self._tracked = True
+        else:
+            self._display_partial(buffer)
 
     def display(self, image):
+        self._highlights.clear()
         if not self._status:
             self._driver.init()
             self._status = True
-        self._driver.display_base(self._driver.get_buffer(image))
-        self._partial_time = 0
-        self._last_display = time.time()
-
-    def display_partial(self, image):
+        self._display_full(self._driver.get_buffer(image, self.reversed))
+        self._tracked = False  # 直接调用display的画面不在Env的脏矩形跟踪范围内
+        self.policy.full_done()
+
+    def _display_full(self, buffer):
+        self._driver.display_base(buffer)
+        self._last_buffer = buffer
+        self.last_region = framebuffer.diff_region(None, buffer)
+
+    def display_partial(self, image, damage=None):
+        """
+        damage: Env给出的脏矩形列表，为空列表时说明画面与上一帧相同，可以跳过转换和比较
+        """
+        self._highlights.clear()
         if not self._status:
             self.display(image)
             return
-        self._driver.display_partial(self._driver.get_buffer(image))
-        self._last_display = time.time()
+        if damage == [] and self._tracked:
+            self.last_region = None
+            return
+        self._display_partial(self._driver.get_buffer(image, self.reversed))
+
+    def _display_partial(self, buffer):
+        self._tracked = True
+        region = framebuffer.diff_region(self._last_buffer, buffer)
+        self.last_region = region
+        if region is None:  # 画面没有变化，不需要刷新
+            return
+        self._driver.display_partial(framebuffer.crop(buffer, region), region)
+        self._last_buffer = buffer
+
+    def invert(self, box, revert=False):
+        """
+        按下反馈：把box内的像素取反并只局部刷新这一块；revert为True时，box仍在反色显示时再取反一次恢复，否则什么也不做
+        每个区域单独记录，取反是异或，多个反馈同时显示时按任意顺序恢复都能回到原来的画面
+        """
+        if not self._status or self._last_buffer is None:
+            return
+        if (box in self._highlights) != revert:  # 已经被新的画面覆盖，或已经在反色显示
+            return
+        if revert:
+            self._highlights.remove(box)
+        else:
+            self._highlights.append(box)
+        self._display_partial(framebuffer.invert(self._last_buffer, box, self.reversed))
+        self._tracked = False  # 屏幕上不再是Env跟踪的那一帧，下一帧要完整比较
 
     def wait_busy(self):
         self._driver.wait_busy()
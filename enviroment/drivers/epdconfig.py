@@ -27,7 +27,10 @@
 # THE SOFTWARE.
 #
 
+import fcntl
 import logging
+import os
+import threading
 import time
 
 import RPi.GPIO as GPIO
@@ -57,6 +60,96 @@ bus = SMBus(1)
 inited = False
 
 
+class BusySignal:
+    """
+    busy引脚的完成事件，代替逐0.1ms读取引脚的忙等
+    busy从1变为0(下降沿)时由GPIO边沿检测set；边沿检测不可用时wait每10ms读取一次电平
+    """
+
+    def __init__(self, pin, grace=0.02):
+        self.pin = pin
+        self.grace = grace  # arm之后的这段时间内引脚可能还没有拉高，不以电平为准
+        self.idle = threading.Event()
+        self.idle.set()
+        self.edge = False  # 是否启用了边沿检测
+        self._armed_at = 0
+
+    def setup(self):
+        if self.edge:
+            return
+        try:
+            GPIO.add_event_detect(self.pin, GPIO.FALLING, callback=self._falling)
+            self.edge = True
+        except RuntimeError:  # 不支持边沿检测时退回电平轮询
+            self.edge = False
+
+    def remove(self):
+        if self.edge:
+            GPIO.remove_event_detect(self.pin)
+            self.edge = False
+
+    def _falling(self, _):
+        self.idle.set()
+
+    def arm(self):  # 发出会让屏幕忙碌的命令前调用
+        self._armed_at = time.time()
+        self.idle.clear()
+
+    def is_busy(self) -> bool:
+        if digital_read(self.pin) == 1:
+            return True
+        if not self.idle.is_set() and time.time() - self._armed_at <= self.grace:
+            return True
+        self.idle.set()
+        return False
+
+    def wait(self, timeout=None) -> bool:  # 等待屏幕空闲，超时返回False
+        start = time.time()
+        while True:
+            if self.idle.wait(0.01) or time.time() - self._armed_at > self.grace:
+                if digital_read(self.pin) == 0:  # 0: idle, 1: busy
+                    self.idle.set()
+                    return True
+                self.idle.clear()
+            if timeout is not None and time.time() - start > timeout:
+                return False
+
+
+busy = BusySignal(EPD_BUSY_PIN)
+
+
+class RawI2C:
+    """
+    直接读取/dev/i2c-N：smbus没有不带命令字节的多字节读取，设置好寄存器地址后用一次read取回全部数据
+    """
+    I2C_SLAVE = 0x0703
+
+    def __init__(self, bus_id=1):
+        self.bus_id = bus_id
+        self._fd = None
+        self._address = None
+        self._lock = threading.Lock()
+
+    def read(self, device, length) -> bytes:
+        with self._lock:
+            if self._fd is None:
+                self._fd = os.open(f"/dev/i2c-{self.bus_id}", os.O_RDWR)
+            if self._address != device:
+                fcntl.ioctl(self._fd, self.I2C_SLAVE, device)
+                self._address = device
+            return os.read(self._fd, length)
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+                self._address = None
+
+
+i2c_raw = RawI2C(1)
+
+
 def digital_write(pin, value):
     GPIO.output(pin, value)
 
@@ -93,6 +186,23 @@ def i2c_readbyte(reg, __len):
     return rbuf
 
 
+def i2c_read_block(reg, length):  # 与i2c_readbyte相同，但只用一次I2C读取
+    i2c_write(reg)
+    return list(i2c_raw.read(address, length))
+
+
+def add_falling_callback(pin, callback) -> bool:  # 注册下降沿回调，不支持边沿检测时返回False
+    try:
+        GPIO.add_event_detect(pin, GPIO.FALLING, callback=callback)
+        return True
+    except RuntimeError:
+        return False
+
+
+def remove_callback(pin):
+    GPIO.remove_event_detect(pin)
+
+
 def module_init():
     global inited
     GPIO.setmode(GPIO.BCM)
@@ -109,6 +219,8 @@ def module_init():
     spi.max_speed_hz = 10000000
     spi.mode = 0b00
 
+    busy.setup()
+
     inited = True
     return 0
 
@@ -117,6 +229,7 @@ def module_exit():
     logging.debug("spi end")
     spi.close()
     bus.close()
+    i2c_raw.close()
 
     logging.debug("close 5V, Module enters 0 power consumption ...")
     GPIO.output(EPD_RST_PIN, 0)
@@ -126,6 +239,7 @@ def module_exit():
 
     GPIO.output(TRST, 0)
 
+    busy.remove()
     GPIO.cleanup()
 
 ### END OF FILE ###
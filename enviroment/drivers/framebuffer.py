@@ -0,0 +1,117 @@
+# 帧缓冲工具：将PIL图片打包为水墨屏RAM所需的1bit数据
+from PIL import Image, ImageDraw, ImageOps
+
+# Display resolution
+EPD_WIDTH = 128
+EPD_HEIGHT = 296
+
+# 每个字节按位反转的查找表，1bit画面旋转180°时使用
+_REVERSED_BITS = bytes(int(f"{i:08b}"[::-1], 2) for i in range(256))
+
+
+def pack(image, width=EPD_WIDTH, height=EPD_HEIGHT, reversed=False) -> bytearray:
+    """
+    将图片转换为buffer，结果与pack_reference逐字节一致
+    竖屏(width x height)直接打包；横屏(height x width)先逆时针旋转90°再打包；reversed为True时再旋转180°
+    """
+    # 单色模式下画面已经是"1"，不需要再转换
+    image_monocolor = image if image.mode == "1" else image.convert('1')
+    imwidth, imheight = image_monocolor.size
+    if imwidth == width and imheight == height:
+        pass
+    elif imwidth == height and imheight == width:
+        image_monocolor = image_monocolor.transpose(Image.ROTATE_90)
+    else:
+        return bytearray([0xFF] * (width // 8 * height))
+    # mode "1" 的 tobytes 按行打包、高位在前、1为白，与屏幕RAM格式相同
+    buffer = bytearray(image_monocolor.tobytes())
+    return rotate_180(buffer) if reversed else buffer
+
+
+def rotate_180(buf) -> bytearray:  # 旋转180°：字节倒序，每个字节内的位也倒序。要求每行的像素数是8的倍数
+    return bytearray(buf[::-1].translate(_REVERSED_BITS))
+
+
+def _clamp(box, width=EPD_HEIGHT, height=EPD_WIDTH):  # 把横屏坐标下的(x_start, x_end, y_start, y_end)限制在屏幕内
+    return max(box[0], 0), min(box[1], width - 1), max(box[2], 0), min(box[3], height - 1)
+
+
+def invert(buf, box, reversed=False) -> bytearray:
+    """
+    把横屏画面中box(x_start, x_end, y_start, y_end，闭区间，与触摸记录的area相同)内的像素取反，返回新的buffer
+    """
+    x_start, x_end, y_start, y_end = _clamp(box)
+    mask = Image.new("1", (EPD_HEIGHT, EPD_WIDTH), 0)
+    ImageDraw.Draw(mask).rectangle((x_start, y_start, x_end, y_end), fill=1)
+    mask = pack(mask, reversed=reversed)
+    return bytearray((int.from_bytes(buf, "big") ^ int.from_bytes(mask, "big")).to_bytes(len(buf), "big"))
+
+
+def invert_image(image, box):  # 与invert相同，但作用于横屏的PIL图片，返回"L"模式的新图片
+    x_start, x_end, y_start, y_end = _clamp(box, *image.size)
+    image = image.convert("L")
+    area = (x_start, y_start, x_end + 1, y_end + 1)
+    image.paste(ImageOps.invert(image.crop(area)), area)
+    return image
+
+
+def pack_reference(image, width=EPD_WIDTH, height=EPD_HEIGHT) -> list:  # 原逐像素实现，仅用于校验和基准测试
+    buf = [0xFF] * (int(width / 8) * height)
+    image_monocolor = image.convert('1')
+    imwidth, imheight = image_monocolor.size
+    pixels = image_monocolor.load()
+    if imwidth == width and imheight == height:
+        for y in range(imheight):
+            for x in range(imwidth):
+                if pixels[x, y] == 0:
+                    buf[int((x + y * width) / 8)] &= ~(0x80 >> (x % 8))
+    elif imwidth == height and imheight == width:
+        for y in range(imheight):
+            for x in range(imwidth):
+                newx = y
+                newy = height - x - 1
+                if pixels[x, y] == 0:
+                    buf[int((newx + newy * width) / 8)] &= ~(0x80 >> (y % 8))
+    return buf
+
+
+def diff_region(old, new, width=EPD_WIDTH):
+    """
+    比较两帧buffer，返回变化部分按字节对齐的包围矩形(x_start, y_start, x_end, y_end)
+    x以字节为单位，y以行为单位，均为闭区间；两帧相同时返回None
+    """
+    if old is None or len(old) != len(new):
+        return 0, 0, width // 8 - 1, len(new) * 8 // width - 1
+    row = width // 8
+    old = memoryview(old)
+    new = memoryview(new)
+    rows = [y for y in range(len(new) // row) if old[y * row: (y + 1) * row] != new[y * row: (y + 1) * row]]
+    if not rows:
+        return None
+    x_start, x_end = row - 1, 0
+    for y in rows:
+        offset = y * row
+        for x in range(x_start):
+            if old[offset + x] != new[offset + x]:
+                x_start = x
+                break
+        for x in range(row - 1, x_end, -1):
+            if old[offset + x] != new[offset + x]:
+                x_end = x
+                break
+    return min(x_start, x_end), rows[0], max(x_start, x_end), rows[-1]
+
+
+def crop(buf, region, width=EPD_WIDTH) -> bytearray:  # 取出区域内的数据，按行排列，可直接写入窗口
+    x_start, y_start, x_end, y_end = region
+    row = width // 8
+    result = bytearray()
+    for y in range(y_start, y_end + 1):
+        result += buf[y * row + x_start: y * row + x_end + 1]
+    return result
+
+
+def changed_pixels(old, new) -> int:  # 两帧之间变化的像素数，old为None时视为整屏变化
+    if old is None or len(old) != len(new):
+        return len(new) * 8
+    return bin(int.from_bytes(old, "big") ^ int.from_bytes(new, "big")).count("1")
@@ -48,6 +48,10 @@ class ICNT86:
     def icnt_read(reg, __len):
         return config.i2c_readbyte(reg, __len)
 
+    @staticmethod
+    def icnt_read_block(reg, length):
+        return config.i2c_read_block(reg, length)
+
     def icnt_read_version(self):
         buf = self.icnt_read(0x000a, 4)
         print(buf)
@@ -158,3 +162,19 @@ class TouchDriver(ICNT86):
         else:
             ICNT_Dev.Touch = 0
             return
+
+    def read_points(self):
+        """
+        一次I2C读取触点数量和全部触点数据，返回[(id, x, y, p), ...]；没有触点时返回[]，数据无效时返回None
+        """
+        buf = self.icnt_read_block(0x1001, 1 + 5 * 7)
+        self.icnt_write(0x1001, 0x00)
+        count = buf[0]
+        if count == 0:
+            return []
+        if count > 5:
+            return None
+        return [(buf[7 + 7 * i],
+                 295 - ((buf[3 + 7 * i] << 8) + buf[2 + 7 * i]),
+                 127 - ((buf[5 + 7 * i] << 8) + buf[4 + 7 * i]),
+                 buf[6 + 7 * i]) for i in range(count)]
@@ -0,0 +1,68 @@
+# 自动刷新策略：按残影预算在局部刷新和全局刷新之间选择
+import time
+
+from enviroment.drivers import framebuffer
+
+
+class RefreshPolicy:
+    """
+    记录自上次全局刷新以来的局部刷新次数、累计变化的像素比例和经过的时间，超出残影预算时选择全局刷新。
+    局部刷新总是只写入变化的窗口(framebuffer.diff_region)，因此这里只需要在"t"和"f"之间选择
+    """
+
+    def __init__(self, ghost_budget=8.0, max_partials=200, max_age=3600, full_ratio=0.6, legacy_interval=60):
+        self.ghost_budget = ghost_budget  # 每次局部刷新累加变化像素占整屏的比例，超过该值时全局刷新
+        self.max_partials = max_partials  # 局部刷新次数上限
+        self.max_age = max_age  # 距离上次全局刷新的最长时间(秒)
+        self.full_ratio = full_ratio  # 单帧变化超过该比例时直接全局刷新
+        self.legacy_interval = legacy_interval  # 原来的策略：每60次局部刷新一次全局刷新，用于统计省下的次数
+
+        self.partials = 0
+        self.ghosting = 0.0
+        self.last_full = time.time()
+
+        self._legacy_partials = 0
+        self.fulls = 0  # 策略选择的全局刷新次数
+        self.legacy_fulls = 0  # 同样的画面按原来的策略需要的全局刷新次数
+
+    @property
+    def saved(self) -> int:  # 与原来的策略相比省下的全局刷新次数
+        return self.legacy_fulls - self.fulls
+
+    @property
+    def report(self) -> dict:
+        return {"partials": self.partials, "ghosting": round(self.ghosting, 3),
+                "since_full": round(time.time() - self.last_full, 1),
+                "fulls": self.fulls, "legacy_fulls": self.legacy_fulls, "saved": self.saved}
+
+    def choose(self, old, new) -> str:
+        """
+        为display_auto的一帧选择刷新方式，old和new为前后两帧的buffer，返回"t"或"f"，并计入统计
+        """
+        ratio = framebuffer.changed_pixels(old, new) / (len(new) * 8)
+        if not ratio:  # 画面没有变化，不会真正刷新
+            return "f"
+        # 原来的策略
+        if self._legacy_partials < self.legacy_interval:
+            self._legacy_partials += 1
+        else:
+            self._legacy_partials = 0
+            self.legacy_fulls += 1
+
+        if (old is None or ratio >= self.full_ratio or self.partials >= self.max_partials
+                or self.ghosting + ratio > self.ghost_budget or time.time() - self.last_full >= self.max_age):
+            self.fulls += 1
+            self._clear()
+            return "t"
+        self.partials += 1
+        self.ghosting += ratio
+        return "f"
+
+    def full_done(self):  # 调用者直接进行了全局刷新(refresh="t")，原来的策略也会在此时重新计数
+        self._legacy_partials = 0
+        self._clear()
+
+    def _clear(self):
+        self.partials = 0
+        self.ghosting = 0.0
+        self.last_full = time.time()
@@ -0,0 +1,181 @@
+# 硬件替身：没有树莓派时代替RPi.GPIO、spidev和smbus，统计SPI/I2C传输和GPIO操作的次数，用于基准测试
+import sys
+import types
+
+
+class Counters:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.spi_transfers = 0  # writebytes/writebytes2的调用次数，每次对应一次系统调用
+        self.spi_bytes = 0
+        self.gpio_writes = 0
+        self.gpio_reads = 0
+        self.i2c_transfers = 0
+
+    @property
+    def report(self) -> dict:
+        return dict(self.__dict__)
+
+
+counters = Counters()
+
+
+class GPIO:
+    BCM = 11
+    OUT = 0
+    IN = 1
+    LOW = 0
+    HIGH = 1
+    FALLING = 32
+    RISING = 31
+    BOTH = 33
+
+    levels = {}  # 引脚电平，没有设置过的输入引脚为0(屏幕空闲、没有触摸中断)
+    callbacks = {}
+
+    @staticmethod
+    def setmode(_):
+        pass
+
+    @staticmethod
+    def setwarnings(_):
+        pass
+
+    @staticmethod
+    def setup(pin, mode, **_):
+        pass
+
+    @classmethod
+    def output(cls, pin, value):
+        counters.gpio_writes += 1
+        cls.levels[pin] = value
+
+    @classmethod
+    def input(cls, pin):
+        counters.gpio_reads += 1
+        return cls.levels.get(pin, 0)
+
+    @classmethod
+    def add_event_detect(cls, pin, edge, callback=None, bouncetime=None):
+        cls.callbacks[pin] = callback
+
+    @classmethod
+    def remove_event_detect(cls, pin):
+        cls.callbacks.pop(pin, None)
+
+    @classmethod
+    def trigger(cls, pin):  # 模拟一次边沿中断
+        callback = cls.callbacks.get(pin)
+        if callback:
+            callback(pin)
+
+    @classmethod
+    def cleanup(cls):
+        cls.callbacks.clear()
+
+
+class SpiDev:
+    def __init__(self, bus=0, device=0):
+        self.max_speed_hz = 0
+        self.mode = 0
+
+    @staticmethod
+    def writebytes(data):
+        counters.spi_transfers += 1
+        counters.spi_bytes += len(data)
+
+    writebytes2 = writebytes
+
+    def close(self):
+        pass
+
+
+class SMBus:
+    """
+    按16位寄存器地址保存数据的I2C设备，寄存器地址在读取后自动递增，与ICNT86相同
+    """
+    instance = None  # epdconfig.bus，供RawI2C和TouchPanel使用
+
+    def __init__(self, bus=1):
+        self.memory = {}  # (设备地址, 寄存器) -> 字节
+        self._pointer = {}  # 设备地址 -> 下一次读取的寄存器
+        SMBus.instance = self
+
+    def write_word_data(self, address, register, value):  # epdconfig.i2c_writebyte：写一个寄存器
+        counters.i2c_transfers += 1
+        self.memory[(address, register << 8 | value & 0xFF)] = value >> 8 & 0xFF
+
+    def write_byte_data(self, address, register, value):  # epdconfig.i2c_write：设置寄存器地址
+        counters.i2c_transfers += 1
+        self._pointer[address] = register << 8 | value
+
+    def read_block(self, address, length) -> bytes:
+        pointer = self._pointer.get(address, 0)
+        self._pointer[address] = pointer + length
+        return bytes(self.memory.get((address, pointer + i), 0) for i in range(length))
+
+    def read_byte(self, address):
+        counters.i2c_transfers += 1
+        return self.read_block(address, 1)[0]
+
+    def close(self):
+        pass
+
+
+class RawI2C:  # 代替epdconfig.i2c_raw
+    @staticmethod
+    def read(device, length) -> bytes:
+        counters.i2c_transfers += 1
+        return SMBus.instance.read_block(device, length)
+
+    def close(self):
+        pass
+
+
+class TouchPanel:
+    """
+    模拟ICNT86触摸屏：press写入触点数据并在INT引脚上产生下降沿，坐标与TouchRecoder中的相同
+    """
+
+    def __init__(self, address=0x48, int_pin=27):
+        self.address = address
+        self.int_pin = int_pin
+        GPIO.levels[int_pin] = 1
+
+    def _write(self, register, values):
+        for i, value in enumerate(values):
+            SMBus.instance.memory[(self.address, register + i)] = value
+
+    def press(self, points):  # points: [(x, y), ...]，最多5个
+        self._write(0x1001, [len(points)])
+        for i, (x, y) in enumerate(points):
+            x, y = 295 - x, 127 - y
+            self._write(0x1002 + 7 * i, [0, x & 0xFF, x >> 8, y & 0xFF, y >> 8, 50, i])
+        self.interrupt()
+
+    def release(self):  # 抬起：触点数量为0
+        self._write(0x1001, [0])
+        self.interrupt()
+
+    def interrupt(self):
+        GPIO.levels[self.int_pin] = 0
+        GPIO.trigger(self.int_pin)
+        GPIO.levels[self.int_pin] = 1
+
+
+def install():
+    """
+    把替身注册为RPi.GPIO、spidev和smbus，并替换epdconfig.i2c_raw，须在其他模块导入epdconfig之前调用
+    """
+    rpi = types.ModuleType("RPi")
+    rpi.GPIO = GPIO
+    spidev = types.ModuleType("spidev")
+    spidev.SpiDev = SpiDev
+    smbus = types.ModuleType("smbus")
+    smbus.SMBus = SMBus
+    sys.modules.update({"RPi": rpi, "RPi.GPIO": GPIO, "spidev": spidev, "smbus": smbus})
+
+    from enviroment.drivers import epdconfig
+    epdconfig.i2c_raw = RawI2C()
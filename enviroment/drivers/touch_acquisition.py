@@ -0,0 +1,165 @@
+# 中断驱动的触摸采集：INT下降沿唤醒采集线程，一次I2C读取全部触点，带时间戳的采样放入有界队列
+import threading
+import time
+import traceback
+from collections import deque
+
+from enviroment.drivers import epdconfig as config
+
+
+class Sample:
+    __slots__ = ("time", "touch", "points")
+
+    def __init__(self, time, touch, points):
+        self.time = time  # time.perf_counter()
+        self.touch = touch  # False表示抬起
+        self.points = points  # [(id, x, y, p), ...]，抬起时为最后一次按下的触点
+
+    def apply(self, dev, old):  # 写入TouchRecoder，old保存上一次的状态，与TouchDriver.icnt_scan相同
+        old.Touch = dev.Touch
+        old.TouchGestureId = dev.TouchGestureId
+        old.TouchCount = dev.TouchCount
+        old.TouchEvenId = dev.TouchEvenId.copy()
+        old.X = dev.X.copy()
+        old.Y = dev.Y.copy()
+        old.P = dev.P.copy()
+        dev.Touch = int(self.touch)
+        if self.touch:
+            dev.TouchCount = len(self.points)
+            for i, (event_id, x, y, p) in enumerate(self.points):
+                dev.TouchEvenId[i] = event_id
+                dev.X[i] = x
+                dev.Y[i] = y
+                dev.P[i] = p
+
+
+class TouchAcquisition:
+    """
+    代替每次扫描轮询INT引脚20次的icnt_scan：
+    采集线程只在INT下降沿被唤醒，用driver.read_points一次读取全部触点；release_timeout秒内没有新的中断视为抬起。
+    不支持边沿检测时退回每5ms读取一次INT电平。采样放入容量为capacity的队列，队列满时丢弃最旧的采样。
+    两次读取至少间隔min_interval秒，期间的中断合并到下一次读取，读到的是最新的触点
+    """
+
+    def __init__(self, driver, capacity=64, release_timeout=0.05, handler=None, min_interval=0.0):
+        self.driver = driver
+        self.release_timeout = release_timeout
+        self.min_interval = min_interval
+        self._last_read = 0.0
+        self._handler = handler if handler else print
+        self._samples = deque(maxlen=capacity)
+        self._condition = threading.Condition()
+        self._event = threading.Event()
+        self.edge = False
+        self.running = False
+        self._threads = []
+
+        # 计数器
+        self.interrupts = 0
+        self.reads = 0
+        self.samples = 0
+        self.dropped = 0
+        self.merged = 0  # 因min_interval合并的中断
+
+    def start(self):
+        self.running = True
+        self.edge = config.add_falling_callback(self.driver.INT, self._falling)
+        self._start_thread(self._run)
+
+    def stop(self, timeout=None):
+        self.running = False
+        if self.edge:
+            config.remove_callback(self.driver.INT)
+            self.edge = False
+        self._event.set()
+        with self._condition:
+            self._condition.notify_all()
+        for i in self._threads:
+            if i is not threading.current_thread():
+                i.join(timeout)
+
+    def _start_thread(self, target, *args):
+        thread = threading.Thread(target=target, args=args, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def _falling(self, _):
+        self.interrupts += 1
+        self._event.set()
+
+    def _wait(self, timeout) -> bool:  # 等待下一次中断，超时返回False
+        if self.edge:
+            woke = self._event.wait(timeout)
+            self._event.clear()
+            return woke
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        while self.running:
+            if self.driver.digital_read(self.driver.INT) == 0:
+                return True
+            if deadline is not None and time.perf_counter() >= deadline:
+                return False
+            time.sleep(0.005)
+        return False
+
+    def _throttle(self):  # 距上一次读取不足min_interval时等待，期间的中断合并到这一次读取
+        delay = self._last_read + self.min_interval - time.perf_counter()
+        if delay > 0:
+            seen = self.interrupts
+            time.sleep(delay)
+            if self.edge:
+                self._event.clear()
+            self.merged += self.interrupts - seen
+        self._last_read = time.perf_counter()
+
+    def _push(self, sample):
+        with self._condition:
+            if len(self._samples) == self._samples.maxlen:
+                self.dropped += 1
+            self._samples.append(sample)
+            self.samples += 1
+            self._condition.notify()
+
+    def _run(self):
+        points = None  # 最后一次按下的触点，None表示没有按下
+        while self.running:
+            woke = self._wait(self.release_timeout if points else None)
+            if not self.running:
+                break
+            if woke:
+                if self.min_interval:
+                    self._throttle()
+                try:
+                    new = self.driver.read_points()
+                except Exception:
+                    self._handler(traceback.format_exc())
+                    continue
+                self.reads += 1
+                if new:
+                    points = new
+                    self._push(Sample(time.perf_counter(), True, new))
+                    continue
+                if new is None:  # 数据无效，等待下一次中断
+                    continue
+            if points:
+                self._push(Sample(time.perf_counter(), False, points))
+                points = None
+
+    def get(self, timeout=None):  # 取出最早的采样，超时返回None
+        with self._condition:
+            if not self._samples:
+                self._condition.wait(timeout)
+            return self._samples.popleft() if self._samples else None
+
+    def pump(self, handle, dev, old):  # 在新线程中把采样依次写入dev/old并调用handle(dev, old, 采样时间)，如TouchHandler.handle
+        self._start_thread(self._pump, handle, dev, old)
+
+    def _pump(self, handle, dev, old):
+        while self.running:
+            sample = self.get()
+            if sample is None:
+                continue
+            sample.apply(dev, old)
+            try:
+                handle(dev, old, sample.time)
+            except Exception:
+                self._handler(traceback.format_exc())
@@ -0,0 +1,163 @@
+# 无界面后端：不需要wx和硬件，用于在开发机上运行、测量和编写脚本
+import threading as _threading
+import time as _time
+from collections import deque as _deque
+
+from enviroment.touchscreen import TouchRecoder as _TouchRecoder
+from enviroment.drivers import framebuffer as _framebuffer, \
+    refresh as _refresh
+from system import tracing as _tracing
+
+
+class Frame:
+    __slots__ = ("time", "refresh", "image", "region")
+
+    def __init__(self, time, refresh, image, region):
+        self.time = time  # time.perf_counter()
+        self.refresh = refresh  # "t"或"f"
+        self.image = image  # 屏幕倒置时为旋转前的画面
+        self.region = region  # framebuffer.diff_region的结果
+
+
+class Headless:
+    """
+    与Simulator接口相同的无界面屏幕和触摸后端
+    显示的画面连同时间戳保存在内存中的环形缓冲区frames里；触摸由touch/tap/swipe/play直接送入TouchHandler.handle；
+    latency不为None时模拟屏幕刷新耗时，例如Headless(latency=Headless.PANEL_LATENCY)
+    """
+    PANEL_LATENCY = {"t": 2.0, "f": 0.3}  # 2.9寸屏全局刷新和局部刷新的大致耗时(秒)
+
+    def __init__(self, capacity=64, latency=None):
+        self.env = None
+        self.frames = _deque(maxlen=capacity)
+        self.latency = latency
+        self.touch_recoder_dev = _TouchRecoder()
+        self.touch_recoder_old = _TouchRecoder()
+
+        self._last_buffer = None
+        self._tracked = False
+        self.last_region = None  # 与硬件Screen相同，记录每次刷新的区域
+        self.policy = _refresh.RefreshPolicy()
+        self.reversed = False  # 与硬件Screen相同，屏幕倒置时在打包buffer时旋转180°
+
+        self.asleep = False  # 与硬件Screen相同，sleep后下一次显示时唤醒
+        self._highlights = []  # 与硬件Screen相同，正在反色显示的区域
+        self._busy_until = 0
+        self._condition = _threading.Condition()
+        self._quit = _threading.Event()
+
+    def start(self, env):  # 与Simulator.start相同，阻塞直到quit
+        self.env = env
+        self._quit.wait()
+
+    def _pack(self, image):
+        with _tracing.stage("convert"):
+            return _framebuffer.pack(image, reversed=self.reversed)
+
+    def _record(self, image, refresh, full, buffer=None):  # buffer为已经打包好的image
+        self.asleep = False
+        self._highlights.clear()
+        if buffer is None:
+            buffer = self._pack(image)
+        region = _framebuffer.diff_region(None if full else self._last_buffer, buffer)
+        self.last_region = region
+        if region is None:
+            return
+        self._last_buffer = buffer
+        if self.latency:
+            self._busy_until = _time.perf_counter() + self.latency.get(refresh, 0)
+        with self._condition:
+            self.frames.append(Frame(_time.perf_counter(), refresh, image, region))
+            self._condition.notify_all()
+
+    def display(self, image):
+        self._tracked = False  # 直接调用display的画面不在Env的脏矩形跟踪范围内
+        self.policy.full_done()
+        self._record(image, "t", True)
+
+    def display_partial(self, image, damage=None):
+        if damage == [] and self._tracked:  # 页面没有变化
+            self.last_region = None
+            return
+        self._tracked = True
+        self._record(image, "f", False)
+
+    def display_auto(self, image, damage=None):
+        if damage == [] and self._tracked:
+            self.last_region = None
+            return
+        buffer = self._pack(image)
+        self._tracked = True
+        if self.policy.choose(self._last_buffer, buffer) == "t":
+            self._record(image, "t", True, buffer)
+        else:
+            self._record(image, "f", False, buffer)
+
+    def invert(self, box, revert=False):  # 与硬件Screen相同的按下反馈，记录为refresh为"i"的一帧
+        if self.asleep or self._last_buffer is None or not self.frames:
+            return
+        if (box in self._highlights) != revert:
+            return
+        if revert:
+            self._highlights.remove(box)
+        else:
+            self._highlights.append(box)
+        buffer = _framebuffer.invert(self._last_buffer, box, self.reversed)
+        region = _framebuffer.diff_region(self._last_buffer, buffer)
+        self._last_buffer = buffer
+        self._tracked = False
+        self.last_region = region
+        with self._condition:
+            self.frames.append(Frame(_time.perf_counter(), "i", _framebuffer.invert_image(self.frames[-1].image, box),
+                                     region))
+            self._condition.notify_all()
+
+    def sleep(self):
+        self.asleep = True
+
+    def wait_busy(self):
+        delay = self._busy_until - _time.perf_counter()
+        if delay > 0:
+            _time.sleep(delay)
+
+    def wait_frame(self, after=None, timeout=5):
+        """
+        等待一帧时间戳晚于after的画面并返回，超时返回None；after为None时等待下一帧
+        """
+        if after is None:
+            after = _time.perf_counter()
+        deadline = _time.perf_counter() + timeout
+        with self._condition:
+            while not self.frames or self.frames[-1].time <= after:
+                remaining = deadline - _time.perf_counter()
+                if remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+            return self.frames[-1]
+
+    # 触摸
+    def touch(self, x, y, touch=True):  # 送入一次触摸状态，touch为False表示抬起
+        self.touch_recoder_old.Touch = self.touch_recoder_dev.Touch
+        self.touch_recoder_dev.Touch = touch
+        self.touch_recoder_dev.X[0] = x
+        self.touch_recoder_dev.Y[0] = y
+        self.env.TouchHandler.handle(self.touch_recoder_dev, self.touch_recoder_old)
+
+    def tap(self, x, y, hold=0.05):
+        self.touch(x, y)
+        _time.sleep(hold)
+        self.touch(x, y, False)
+
+    def swipe(self, start, end, steps=10, duration=0.2):
+        for i in range(steps + 1):
+            self.touch(start[0] + (end[0] - start[0]) * i // steps, start[1] + (end[1] - start[1]) * i // steps)
+            _time.sleep(duration / steps)
+        self.touch(end[0], end[1], False)
+
+    def play(self, script):  # script: [(延时, x, y, touch), ...]，按顺序送入触摸状态
+        for delay, x, y, touch in script:
+            _time.sleep(delay)
+            self.touch(x, y, touch)
+
+    def quit(self):
+        self._quit.set()
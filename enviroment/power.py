@@ -0,0 +1,132 @@
+# 电源管理：一段时间没有触摸后让屏幕进入深度睡眠，触摸或整分钟的定时任务会唤醒它
+import threading as _threading
+import time as _time
+import traceback as _traceback
+
+
+class PowerManager:
+    """
+    idle_timeout秒没有触摸后通过AsyncDisplay.sleep让屏幕进入深度睡眠，为0时不自动睡眠；
+    触摸时唤醒并以全局刷新推送当前画面，屏幕在显示线程中重新初始化，不阻塞触摸。
+    每分钟的定时任务用add_tick注册，由同一个线程在整分钟调用，代替各处每隔几秒检查一次时间的线程；
+    睡眠期间定时任务产生的画面显示完后屏幕立即重新睡眠
+    """
+
+    def __init__(self, env, idle_timeout=60, handler=None):
+        self.env = env
+        self.idle_timeout = idle_timeout
+        self._handler = handler if handler else print
+
+        self._lock = _threading.Lock()
+        self._event = _threading.Event()
+        self._ticks = []
+        self.running = False
+        self._thread = None
+
+        self.state = "active"  # "active"或"sleep"
+        self._since = _time.monotonic()
+        self._last_activity = self._since
+
+        # 计数器
+        self.durations = {"active": 0.0, "sleep": 0.0}  # 各状态累计的秒数，不含当前状态，见report
+        self.sleeps = 0
+        self.wakes = 0
+        self.ticks = 0
+
+    @property
+    def report(self) -> dict:
+        with self._lock:
+            durations = dict(self.durations)
+            durations[self.state] += _time.monotonic() - self._since
+            return {"state": self.state, "durations": durations,
+                    "sleeps": self.sleeps, "wakes": self.wakes, "ticks": self.ticks}
+
+    def start(self):
+        self.running = True
+        self._thread = _threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self.running = False
+        self._event.set()
+        if self._thread and self._thread is not _threading.current_thread():
+            self._thread.join(timeout)
+
+    def add_tick(self, func):  # 每到整分钟调用func()
+        with self._lock:
+            if func not in self._ticks:
+                self._ticks.append(func)
+
+    def remove_tick(self, func):
+        with self._lock:
+            if func in self._ticks:
+                self._ticks.remove(func)
+
+    def activity(self):  # 在TouchHandler.handle中调用
+        with self._lock:
+            self._last_activity = _time.monotonic()
+            wake = self.state == "sleep"
+            if wake:
+                self._set_state("active")
+                self.wakes += 1
+        if wake:
+            self.env.display(refresh="t")  # 屏幕在显示线程中重新初始化
+            self._event.set()
+
+    def woken(self):  # 不是触摸产生的画面唤醒了屏幕，由AsyncDisplay在显示线程中调用
+        with self._lock:
+            if self.state != "sleep":
+                return
+            self._set_state("active")
+            self.wakes += 1
+        self._event.set()  # 重新计算等待时间，空闲已经超时的话立即重新睡眠
+
+    def _set_state(self, state):  # 调用时需持有self._lock
+        now = _time.monotonic()
+        self.durations[self.state] += now - self._since
+        self._since = now
+        self.state = state
+
+    def _sleep(self) -> bool:
+        self.env.Compositor.flush(5)
+        if not self.env.Display.sleep():  # 还有待显示的画面
+            return False
+        with self._lock:
+            if self.state == "active" and _time.monotonic() - self._last_activity >= self.idle_timeout:
+                self._set_state("sleep")
+                self.sleeps += 1
+        return True
+
+    def _tick(self):
+        with self._lock:
+            ticks = list(self._ticks)
+            self.ticks += 1
+        for func in ticks:
+            try:
+                func()
+            except Exception:
+                self._handler(_traceback.format_exc())
+
+    def _run(self):
+        next_tick = (_time.time() // 60 + 1) * 60
+        while self.running:
+            delay = next_tick - _time.time()
+            with self._lock:
+                if self.state == "active" and self.idle_timeout:
+                    delay = min(delay, self._last_activity + self.idle_timeout - _time.monotonic())
+            self._event.wait(max(delay, 0))
+            self._event.clear()
+            if not self.running:
+                break
+            ticked = _time.time() >= next_tick
+            if ticked:
+                self._tick()
+                next_tick = (_time.time() // 60 + 1) * 60
+            with self._lock:
+                if self.state == "sleep":
+                    sleep = ticked
+                else:
+                    sleep = bool(self.idle_timeout) and \
+                        _time.monotonic() - self._last_activity >= self.idle_timeout
+            if sleep and not self._sleep():
+                self._event.wait(1)  # 稍后再试
@@ -0,0 +1,164 @@
+# 会话录制与回放：记录触摸状态和输出的画面，回放时把同样的触摸送入新的Env并比较画面和时间
+import io as _io
+import struct as _struct
+import threading as _threading
+import time as _time
+import zlib as _zlib
+
+from enviroment.touchscreen import TouchRecoder as _TouchRecoder
+from enviroment.drivers import framebuffer as _framebuffer
+
+MAGIC = b"EIR1"
+_HEADER = _struct.Struct("<cdI")  # 类型, 距开始录制的秒数, 数据长度
+_TOUCH = _struct.Struct("<46h")  # ICNT_Dev和ICNT_Old各23个整数
+
+
+def _touch_state(recoder) -> list:
+    return [int(recoder.Touch), recoder.TouchGestureId, recoder.TouchCount] + \
+        list(recoder.TouchEvenId) + list(recoder.X) + list(recoder.Y) + list(recoder.P)
+
+
+def _touch_recoder(state) -> _TouchRecoder:
+    recoder = _TouchRecoder()
+    recoder.Touch, recoder.TouchGestureId, recoder.TouchCount = state[:3]
+    recoder.TouchEvenId = list(state[3:8])
+    recoder.X = list(state[8:13])
+    recoder.Y = list(state[13:18])
+    recoder.P = list(state[18:23])
+    return recoder
+
+
+def _xor(a, b) -> bytes:
+    return (int.from_bytes(a, "big") ^ int.from_bytes(b, "big")).to_bytes(len(b), "big")
+
+
+class Recorder:
+    """
+    把触摸状态和输出的画面写入target(文件路径或可写的二进制文件对象)
+    画面按framebuffer.pack打包为1bit，与上一帧异或后用zlib压缩，没有变化的部分几乎不占空间
+    """
+
+    def __init__(self, target):
+        if hasattr(target, "write"):
+            self._file = target
+            self._own = False
+        else:
+            self._file = open(target, "wb")
+            self._own = True
+        self._file.write(MAGIC)
+        self._start = _time.perf_counter()
+        self._last = bytes(_framebuffer.EPD_WIDTH // 8 * _framebuffer.EPD_HEIGHT)
+        self._lock = _threading.Lock()
+        self.framed = _threading.Event()  # 写入第一帧画面后置位
+
+    def _write(self, kind, payload):  # 头和数据一次写入，其他线程读取时不会只读到头
+        with self._lock:
+            self._file.write(_HEADER.pack(kind, _time.perf_counter() - self._start, len(payload)) + payload)
+
+    def touch(self, dev, old):  # 在TouchHandler.handle中调用
+        self._write(b"T", _TOUCH.pack(*_touch_state(dev), *_touch_state(old)))
+
+    def frame(self, image, refresh):  # 在Env._push中调用
+        buffer = bytes(_framebuffer.pack(image))
+        with self._lock:
+            delta, self._last = _xor(self._last, buffer), buffer
+        self._write(b"F", refresh.encode() + _zlib.compress(delta))
+        self.framed.set()
+
+    def close(self):  # 写入结束标记，回放以它确定会话的长度
+        self._write(b"E", b"")
+        with self._lock:
+            if self._own:
+                self._file.close()
+            else:
+                self._file.flush()
+
+
+def read(source):
+    """
+    读取录制的内容，source为文件路径、bytes或二进制文件对象
+    依次产生("touch", 秒数, ICNT_Dev, ICNT_Old)、("frame", 秒数, 刷新方式, buffer)，最后是("end", 秒数)
+    末尾不完整的记录(录制中途读取或写入被打断)被忽略
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = _io.BytesIO(source)
+    file = source if hasattr(source, "read") else open(source, "rb")
+    try:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError("Not a session recording.")
+        last = bytes(_framebuffer.EPD_WIDTH // 8 * _framebuffer.EPD_HEIGHT)
+        while True:
+            header = file.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                return
+            kind, moment, length = _HEADER.unpack(header)
+            payload = file.read(length)
+            if len(payload) < length:
+                return
+            if kind == b"T":
+                state = _TOUCH.unpack(payload)
+                yield "touch", moment, _touch_recoder(state[:23]), _touch_recoder(state[23:])
+            elif kind == b"F":
+                last = _xor(last, _zlib.decompress(payload[1:]))
+                yield "frame", moment, payload[:1].decode(), last
+            elif kind == b"E":
+                yield "end", moment
+    finally:
+        if file is not source:
+            file.close()
+
+
+def replay(env, records, settle=0.5, timeout=10.0) -> list:
+    """
+    把records中的触摸按原来的时间送入env.TouchHandler，返回回放期间env输出的记录
+    以第一帧画面为时间起点：等env输出第一帧后，按触摸相对原第一帧的时间送入，到原会话结束后再等待settle秒
+    timeout秒内env没有输出画面时抛出TimeoutError
+    """
+    records = list(records)
+    frames = [i for i in records if i[0] == "frame"]
+    origin = frames[0][1] if frames else 0
+    output = _io.BytesIO()
+    env.start_recording(output)
+    if not env.Recorder.framed.wait(timeout):
+        env.stop_recording()
+        raise TimeoutError(f"No frame was displayed within {timeout}s.")
+    start = _time.perf_counter()
+    for record in records:
+        if record[0] != "touch" or record[1] < origin:
+            continue
+        delay = record[1] - origin - (_time.perf_counter() - start)
+        if delay > 0:
+            _time.sleep(delay)
+        env.TouchHandler.handle(record[2], record[3])
+    end = max(i[1] for i in records) - origin + settle
+    delay = end - (_time.perf_counter() - start)
+    if delay > 0:
+        _time.sleep(delay)
+    env.stop_recording()
+    return list(read(output.getvalue()))
+
+
+def compare(expected, actual) -> dict:
+    """
+    按顺序匹配两次录制中的画面，返回匹配数量、缺失的帧和匹配帧的时间差(秒，正数表示回放更慢)
+    两边都以各自的第一帧为时间起点；画面中含有时钟等随时间变化的内容时，跨过分钟的帧无法匹配
+    """
+    expected = [i for i in expected if i[0] == "frame"]
+    actual = [i for i in actual if i[0] == "frame"]
+    if not expected or not actual:
+        return {"expected": len(expected), "actual": len(actual), "matched": 0, "missing": list(range(len(expected))),
+                "delays": []}
+    expected_origin, actual_origin = expected[0][1], actual[0][1]
+    missing = []
+    delays = []
+    at = 0
+    for index, (_, moment, _, buffer) in enumerate(expected):
+        for j in range(at, len(actual)):
+            if actual[j][3] == buffer:
+                delays.append((actual[j][1] - actual_origin) - (moment - expected_origin))
+                at = j + 1
+                break
+        else:
+            missing.append(index)
+    return {"expected": len(expected), "actual": len(actual), "matched": len(expected) - len(missing),
+            "missing": missing, "delays": delays, "final_equal": expected[-1][3] == actual[-1][3]}
@@ -1,26 +1,13 @@
 import threading as _threading
-import time
 import time as _time
+import traceback as _traceback
+from collections import deque as _deque
 
-from enviroment.touchscreen.events import Clicked, Slide, SlideY, SlideB
+from system import tracing as _tracing
 
-
-class _ReIter:  # 反向迭代器
-    def __init__(self, content):
-        self.content = content
-        self.index = None
-
-    def __iter__(self):
-        self.index = len(self.content)
-        return self
-
-    def __next__(self):
-        if self.index <= 0:
-            self.index = len(self.content)
-            raise StopIteration
-        else:
-            self.index -= 1
-            return self.content[self.index]
+from enviroment.touchscreen.events import Clicked, Slide, SlideX, SlideY, SlideB, \
+    LongPress, DoubleClicked, Fling, TwoFingerSlide, Pinch
+from enviroment.touchscreen.gestures import Recognizer
 
 
 class TouchRecoder:
@@ -36,6 +23,8 @@ class TouchRecoder:
 
 
 class TouchHandler:
+    HIGHLIGHT_HOLD = 0.5  # 点击后按下反馈保留的秒数，应用的新画面通常在此之前把它覆盖
+
     def __init__(self, env):
         self.env = env
         self.pool = env.Pool
@@ -49,7 +38,16 @@ class TouchHandler:
         self.back_right = SlideB()
         self.home_bar = SlideY()
 
-        self.double_clicked_flag = 0
+        self.recognizer = Recognizer()
+        self._samples = _deque(maxlen=64)  # handle放入、分发线程取出的触摸采样，满时丢弃最旧的
+        self._wake = _threading.Event()
+        self._thread = None
+        self.running = False
+        self.dropped = 0
+        self.coalesced = 0  # 分发前被更新的移动采样取代的移动采样
+        self._long_press_timer = None
+        self._pressed = []  # 按下时命中的记录，从上层到下层
+        self._highlighted = None  # 正在显示按下反馈的区域
 
     def set_clicked(self, content):
         self.data_lock.acquire()
@@ -111,26 +109,126 @@ class TouchHandler:
         self.slide_y = []
         self.data_lock.release()
 
-    def handle(self, ICNT_Dev: TouchRecoder, ICNT_Old: TouchRecoder):
-        self.env.Now.Book.Page.touch_records_rlock.acquire()
-        self.data_lock.acquire()
-        d_t = ICNT_Dev.Touch
-        o_t = ICNT_Old.Touch
-        d_x = ICNT_Dev.X[0]
-        d_y = ICNT_Dev.Y[0]
+    def _release_pressed(self, hold=0.0):  # 取消按下时命中的记录，hold秒后恢复按下反馈
+        for i in self._pressed:
+            i.active = False
+        self._pressed = []
+        self._release_highlight(hold)
+        if self._long_press_timer:
+            self._long_press_timer.cancel()
+            self._long_press_timer = None
+
+    def _highlight(self):  # 最上层命中的Clicked允许时，不等应用渲染，立即在屏幕上反色显示它的区域
+        for i in self._pressed:
+            if isinstance(i, Clicked):
+                if i.highlight and self.env.press_highlight:
+                    self._highlighted = i.area
+                    self.env.Display.invert(i.area)
+                return
+
+    def _release_highlight(self, hold=0.0):  # 屏幕已经显示了新的画面时，恢复不会做任何事
+        area, self._highlighted = self._highlighted, None
+        if area is None:
+            return
+        if hold:
+            timer = _threading.Timer(hold, self.env.Display.invert, (area, True))
+            timer.daemon = True
+            timer.start()
+        else:
+            self.env.Display.invert(area, True)
+
+    def _fire(self, kind, *args) -> bool:  # 触发按下时命中的最上层kind类记录
+        for i in self._pressed:
+            if isinstance(i, kind) and i.active:
+                i.active = False
+                self.pool.add(i.func, *args)
+                self.env.feedback_vibrate_async()
+                return True
+        return False
+
+    def _long_press(self):  # 长按计时器到期，手指仍没有移动时触发LongPress，之后抬起不再触发点击
+        with self.data_lock:
+            if self.recognizer.check_long_press(_time.perf_counter()) and self._fire(LongPress):
+                for i in self._pressed:
+                    i.active = False
+
+    def start(self):
+        self.running = True
+        self._thread = _threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self.running = False
+        self._wake.set()
+        if self._thread and self._thread is not _threading.current_thread():
+            self._thread.join(timeout)
+
+    def handle(self, ICNT_Dev: TouchRecoder, ICNT_Old: TouchRecoder, moment=None):
+        """
+        复制一次触摸状态放入队列后立即返回，由分发线程按顺序处理，调用者不会等待页面更新或渲染
+        只应由一个线程调用(触摸采集线程或模拟器)，ICNT_Dev和ICNT_Old返回后即可复用
+        moment: 采样的time.perf_counter()，默认为调用的时间，是延迟追踪的起点
+        """
+        recorder = self.env.Recorder
+        if recorder:
+            recorder.touch(ICNT_Dev, ICNT_Old)
+        self.env.Power.activity()
+        if len(self._samples) == self._samples.maxlen:
+            self.dropped += 1
+        self._samples.append((self.env.Tracer.begin(moment), ICNT_Dev.Touch, ICNT_Old.Touch, ICNT_Dev.TouchCount,
+                              ICNT_Dev.X[0], ICNT_Dev.Y[0], ICNT_Dev.X[1], ICNT_Dev.Y[1],
+                              ICNT_Old.X[0], ICNT_Old.Y[0]))
+        self._wake.set()
+
+    def _run(self):
+        while self.running:
+            self._wake.wait()
+            self._wake.clear()
+            while self._samples and self.running:
+                sample = self._samples.popleft()
+                # 连续的移动(触点数量不变)只处理最新的位置，保留最早的追踪和移动前的位置
+                while sample[1] and sample[2] and self._samples:
+                    newer = self._samples[0]
+                    if not (newer[1] and newer[2] and newer[3] == sample[3]):
+                        break
+                    self._samples.popleft()
+                    sample = sample[:1] + newer[1:8] + sample[8:]
+                    self.coalesced += 1
+                try:
+                    self._dispatch(*sample)
+                except Exception:
+                    self.env.Logger.error(_traceback.format_exc())
+
+    def _dispatch(self, trace, *sample):
+        _tracing.activate((trace,))  # 回调和显示请求继续这个追踪
+        try:
+            with self.data_lock:
+                self._evaluate(trace.start, *sample)
+            _tracing.record("dispatch", _time.perf_counter() - trace.start)
+        finally:
+            _tracing.activate(())
+
+    def _evaluate(self, moment, d_t, o_t, count, d_x, d_y, x_1, y_1, o_x, o_y):
+        """
+        处理一个触摸采样，调用时需持有self.data_lock；命中测试只读取页面发布的触摸记录快照，不持有页面的锁
+        """
+        if not d_t:
+            count = 0
+        moved = not (d_x == o_x and d_y == o_y)
 
         if self.env.system_book.take_over:
-            app_clicked = self.env.system_book.touch_records_clicked
-            app_slide_x = self.env.system_book.touch_records_slide_x
-            app_slide_y = self.env.system_book.touch_records_slide_y
+            sources = self.env.system_book.touch_sources
         else:
-            app_slide_x = self.env.Now.touch_records_slide_x
-            app_slide_y = self.env.Now.touch_records_slide_y
-            app_clicked = self.env.Now.touch_records_clicked
+            sources = self.env.Now.touch_sources
 
         if self.env.screen_reversed:
             d_x = 296 - d_x
             d_y = 128 - d_y
+            x_1 = 296 - x_1
+            y_1 = 128 - y_1
+        if d_t and not o_t:
+            self.recognizer.cancel()  # 没有收到上一次抬起时丢弃未完成的手势
+        gesture = self.recognizer.feed(moment, d_t, d_x, d_y, count, x_1, y_1) if d_t or o_t else None
 
         if d_t and not o_t:  # Start touching
             print(f"Start Touch: [{d_x}, {d_y}]")
@@ -141,24 +239,27 @@ class TouchHandler:
             elif d_y >= 108 and 100 <= d_x <= 200:
                 self.home_bar.temp_location = (d_x, d_y)
 
-            for i in _ReIter(app_slide_x):
-                if i.area[0] <= d_x <= i.area[1] and i.area[2] <= d_y <= i.area[3]:
-                    i.temp_location = (d_x, d_y)
-            for i in _ReIter(app_slide_y):
-                if i.area[0] <= d_x <= i.area[1] and i.area[2] <= d_y <= i.area[3]:
-                    i.temp_location = (d_x, d_y)
-            # for i in _ReIter(self.clicked):
-            #     if i.area[0] <= d_x <= i.area[1] and i.area[2] <= d_y <= i.area[3]:
-            #         i.temp_location = (d_x, d_y)
-            for i in _ReIter(app_clicked):
-                if i.area[0] <= d_x <= i.area[1] and i.area[2] <= d_y <= i.area[3]:
+            # 从上层到下层记下所有命中的记录，抬起时只需检查它们
+            self._release_pressed()
+            for index in sources:
+                for i in index.query(d_x, d_y):
                     i.temp_location = (d_x, d_y)
+                    self._pressed.append(i)
+            self._highlight()
+            if any(isinstance(i, LongPress) for i in self._pressed):
+                self._long_press_timer = _threading.Timer(Recognizer.LONG_PRESS, self._long_press)
+                self._long_press_timer.daemon = True
+                self._long_press_timer.start()
 
         elif not d_t and o_t:  # Stop touching
-            if time.time() - self.double_clicked_flag < 0.4:
-                self.pool.add(self.env.display, refresh="t")
-                self.env.feedback_vibrate_async()
-                self.double_clicked_flag = 0
+            if gesture.kind in ("tap2", "swipe2", "pinch"):  # 双指手势，双指点击以全局刷新重新显示
+                if gesture.kind == "tap2":
+                    self.pool.add(self.env.display, refresh="t")
+                    self.env.feedback_vibrate_async()
+                elif gesture.kind == "swipe2":
+                    self._fire(TwoFingerSlide, gesture.dis_x, gesture.dis_y)
+                else:
+                    self._fire(Pinch, gesture.scale)
 
                 self.env.show_left_back = False
                 self.back_left.active = False
@@ -171,16 +272,10 @@ class TouchHandler:
                     i.active = False
                 for i in self.slide_y:
                     i.active = False
-                for i in app_clicked:
-                    i.active = False
-                for i in app_slide_x:
-                    i.active = False
-                for i in app_slide_y:
-                    i.active = False
-                self.env.Now.Book.Page.touch_records_rlock.release()
-                self.data_lock.release()
+                self._release_pressed()
                 return
             print(f"Stop Touch: [{d_x}, {d_y}]")
+            pressed = self._pressed
             slided = False
             if self.back_left.active:
                 if d_x - self.back_left.temp_location[0] > 20:
@@ -203,67 +298,53 @@ class TouchHandler:
                     self.pool.add(self.env.home_bar)
                     slided = True
                 self.home_bar.active = False
-            if slided:
-                for i in app_slide_y:
-                    i.active = False
-                for i in app_slide_x:
-                    i.active = False
-            else:
-                for i in _ReIter(app_slide_y):
-                    if i.active:
+            if not slided:
+                for i in pressed:
+                    if isinstance(i, SlideY) and i.active:
                         i.active = False
                         dis_y = d_y - i.temp_location[1]
                         if i.limit == "+" and dis_y <= 0:
                             continue
                         elif i.limit == "-" and dis_y >= 0:
                             continue
-                        dis_x = d_x - i.temp_location[0]
-                        if abs(dis_y) > 20 and abs(dis_x * 10 // dis_y) <= 5:
+                        if gesture.slide("y"):
                             self.pool.add(i.func, dis_y)
                             slided = True
 
-                for i in _ReIter(app_slide_x):
-                    if i.active:
+                for i in pressed:
+                    if isinstance(i, SlideX) and i.active:
                         i.active = False
                         dis_x = d_x - i.temp_location[0]
                         if i.limit == "+" and dis_x <= 0:
                             continue
                         elif i.limit == "-" and dis_x >= 0:
                             continue
-                        dis_y = d_y - i.temp_location[1]
-                        if abs(dis_x) > 20 and abs(dis_y * 10 // dis_x) <= 5:
+                        if gesture.slide("x"):
                             self.pool.add(i.func, dis_x)
                             slided = True
 
+                if gesture.kind == "fling" and self._fire(Fling, gesture.velocity_x, gesture.velocity_y):
+                    slided = True
+
+            hold = 0.0
             if slided:
-                for i in app_clicked:
-                    i.active = False
                 for i in self.clicked:
                     i.active = False
-            else:
-                # for i in _ReIter(self.clicked):
-                #     if i.active:
-                #         i.active = False
-                #         if i.area[0] <= d_x <= i.area[1] and i.area[2] <= d_y <= i.area[3]:
-                #             self.pool.add(i.func, *i.args, **i.kwargs)
-                #             if i.vibrate:
-                #                 self.env.feedback_vibrate_async()
-                #             break
-                # else:
-                for i in _ReIter(app_clicked):
-                    if i.active:
-                        i.active = False
+            elif not (gesture.kind == "double_tap" and self._fire(DoubleClicked)):
+                for i in pressed:
+                    if isinstance(i, Clicked) and i.active:
                         if i.area[0] <= d_x <= i.area[1] and i.area[2] <= d_y <= i.area[3]:
                             self.pool.add(i.func, *i.args, **i.kwargs)
                             if i.vibrate:
                                 self.env.feedback_vibrate_async()
+                            hold = self.HIGHLIGHT_HOLD
                             break
+            self._release_pressed(hold)
 
         elif d_t and o_t:  # Keep touching
-            if ICNT_Dev.TouchCount >= 2:
-                self.double_clicked_flag = _time.time()
-
-            if not (ICNT_Dev.X[0] == ICNT_Old.X[0] and ICNT_Dev.Y[0] == ICNT_Old.Y[0]):
+            if self._highlighted and self.recognizer.state in ("move", "multi"):  # 开始滑动，不再是点击
+                self._release_highlight()
+            if moved:
                 if self.back_left.active and not self.back_left.showed:
                     if d_x - self.back_left.temp_location[0] >= 20:
                         self.pool.add(self.env.back_left, True)
@@ -272,6 +353,3 @@ class TouchHandler:
                     if self.back_right.temp_location[0] - d_x >= 20:
                         self.pool.add(self.env.back_right, True)
                         self.back_right.showed = True
-
-        self.env.Now.Book.Page.touch_records_rlock.release()
-        self.data_lock.release()
@@ -8,6 +8,7 @@ class Clicked:  # call the function when the object is clicked.
         self.kwargs = kwargs
 
         self.vibrate = True
+        self.highlight = False  # 按下时立即反色显示area，见TouchHandler
 
     @property
     def temp_location(self):
@@ -63,3 +64,40 @@ class SlideB(Slide):
         if not value:
             self.showed = False
         self._active = value
+
+
+class GestureRecord:  # 手势记录的基类：在area内开始的手势被识别后调用func，参数见各子类
+    def __init__(self, area=(0, 0, 0, 0), func=lambda *_: None):
+        self.area = area
+        self._temp_location = (0, 0)
+        self.active = False
+        self.func = func
+
+    @property
+    def temp_location(self):
+        return self._temp_location
+
+    @temp_location.setter
+    def temp_location(self, value):
+        self._temp_location = value
+        self.active = True
+
+
+class LongPress(GestureRecord):  # 长按，func()；触发后抬起时不再触发Clicked
+    pass
+
+
+class DoubleClicked(GestureRecord):  # 双击，func()；第二次点击触发它而不是Clicked
+    pass
+
+
+class Fling(GestureRecord):  # 快速滑动，func(velocity_x, velocity_y)，单位为像素/秒
+    pass
+
+
+class TwoFingerSlide(GestureRecord):  # 双指滑动，func(dis_x, dis_y)
+    pass
+
+
+class Pinch(GestureRecord):  # 双指缩放，func(scale)，scale为两指距离之比
+    pass
@@ -0,0 +1,156 @@
+# 手势识别：按带时间戳的触摸采样推进的状态机，每个采样只做常数次运算，不保存历史轨迹
+import math as _math
+
+
+class Gesture:
+    """
+    识别出的手势，kind为：
+    "tap" 点击，"double_tap" 双击，"drag" 移动后抬起但不构成滑动，"swipe" 滑动，"fling" 快速滑动，
+    "long_press" 长按(按住期间产生)，"tap2" 双指点击，"swipe2" 双指滑动，"pinch" 双指缩放
+    """
+    __slots__ = ("kind", "x", "y", "dis_x", "dis_y", "velocity_x", "velocity_y", "scale", "held")
+
+    def __init__(self, kind, x, y, dis_x=0, dis_y=0, velocity_x=0.0, velocity_y=0.0, scale=1.0, held=False):
+        self.kind = kind
+        self.x = x  # 手势结束(长按为按下)的位置，双指手势为两指的中点
+        self.y = y
+        self.dis_x = dis_x  # 从按下到抬起的位移
+        self.dis_y = dis_y
+        self.velocity_x = velocity_x  # 抬起前的速度，像素/秒
+        self.velocity_y = velocity_y
+        self.scale = scale  # 双指距离之比
+        self.held = held  # 是否已经产生过long_press
+
+    def slide(self, axis) -> int:
+        """
+        沿axis("x"或"y")滑动的距离，不构成该方向的滑动时为0，用于SlideX和SlideY
+        位移超过SWIPE_DISTANCE且与轴的夹角不超过约27度；较短的快速滑动只构成fling
+        """
+        if self.kind not in ("swipe", "fling"):
+            return 0
+        along, across = (self.dis_x, self.dis_y) if axis == "x" else (self.dis_y, self.dis_x)
+        if abs(along) > Recognizer.SWIPE_DISTANCE and abs(across * 10 // along) <= 5:
+            return along
+        return 0
+
+
+class Recognizer:
+    """
+    feed按时间顺序接收采样，在手势结束时返回Gesture，其余时候返回None；长按没有采样驱动，由check_long_press查询
+    速度为相邻采样瞬时速度的指数滑动平均，双指手势只比较开始和当前两指的中点与距离
+    """
+    TAP_SLOP = 10  # 位移不超过它时仍是点击或长按
+    SWIPE_DISTANCE = 20
+    FLING_DISTANCE = 10  # 快速滑动(Fling)的最小位移
+    FLING_VELOCITY = 300  # 像素/秒
+    LONG_PRESS = 0.6  # 秒
+    DOUBLE_TAP = 0.3  # 两次点击的最大间隔，秒
+    DOUBLE_TAP_SLOP = 20  # 两次点击位置的最大距离
+    PINCH_RATIO = 0.2  # 两指距离变化超过这个比例时为缩放
+    SMOOTHING = 0.6  # 速度滑动平均中新采样的权重
+
+    def __init__(self):
+        self.state = "idle"  # "idle"、"down"(单指，未超出TAP_SLOP)、"move"、"long"、"multi"
+        self._down_time = 0.0
+        self._start = (0, 0)
+        self._last = (0, 0)
+        self._last_time = 0.0
+        self._velocity = (0.0, 0.0)
+        self._multi_start = None  # 双指开始时的(中点x, 中点y, 距离)
+        self._multi_last = None
+        self._tap = None  # 上一次点击的(时间, x, y)，用于识别双击
+
+    @staticmethod
+    def _pair(x0, y0, x1, y1):
+        return (x0 + x1) / 2, (y0 + y1) / 2, _math.hypot(x1 - x0, y1 - y0)
+
+    def _update_velocity(self, x, y, d_t):
+        a = self.SMOOTHING
+        self._velocity = (a * (x - self._last[0]) / d_t + (1 - a) * self._velocity[0],
+                          a * (y - self._last[1]) / d_t + (1 - a) * self._velocity[1])
+        self._last = (x, y)
+
+    def feed(self, moment, touch, x, y, count=1, x1=0, y1=0):
+        """
+        moment: 采样时间(秒)，touch: 是否按下，(x, y): 第一个触点，count和(x1, y1): 触点数量和第二个触点
+        """
+        if touch:
+            if self.state == "idle":
+                self.state = "down"
+                self._down_time = self._last_time = moment
+                self._start = self._last = (x, y)
+                self._velocity = (0.0, 0.0)
+                self._multi_start = self._multi_last = None
+            else:
+                d_t = moment - self._last_time
+                if d_t > 0:
+                    self._update_velocity(x, y, d_t)
+                self._last = (x, y)
+                self._last_time = moment
+                if self.state == "down" and \
+                        max(abs(x - self._start[0]), abs(y - self._start[1])) > self.TAP_SLOP:
+                    self.state = "move"
+            if count >= 2 and self.state != "long":
+                pair = self._pair(x, y, x1, y1)
+                if self.state != "multi":
+                    self.state = "multi"
+                    self._multi_start = pair
+                self._multi_last = pair
+            return None
+
+        state, self.state = self.state, "idle"
+        if state == "idle":  # 没有收到按下，只知道抬起的位置
+            return Gesture("drag", x, y)
+        if state == "multi":
+            start, last = self._multi_start, self._multi_last
+            dis_x, dis_y = round(last[0] - start[0]), round(last[1] - start[1])
+            scale = last[2] / start[2] if start[2] else 1.0
+            if abs(scale - 1) > self.PINCH_RATIO:
+                kind = "pinch"
+            elif max(abs(dis_x), abs(dis_y)) > self.SWIPE_DISTANCE:
+                kind = "swipe2"
+            else:
+                kind = "tap2"
+            return Gesture(kind, round(last[0]), round(last[1]), dis_x, dis_y, scale=scale)
+
+        # 抬起的位置也是一个采样，它可能代替了被合并或限速丢弃的移动
+        if (x, y) != self._last and state != "long":
+            d_t = moment - self._last_time
+            if d_t > 0:
+                self._update_velocity(x, y, d_t)
+                self._last_time = moment
+            if state == "down" and max(abs(x - self._start[0]), abs(y - self._start[1])) > self.TAP_SLOP:
+                state = "move"
+        dis_x, dis_y = x - self._start[0], y - self._start[1]
+        velocity_x, velocity_y = self._velocity
+        if moment - self._last_time > 0.1:  # 停下后才抬起
+            velocity_x = velocity_y = 0.0
+        if state in ("down", "long"):
+            kind = "tap"
+            tap = self._tap
+            if state == "down" and tap and moment - tap[0] <= self.DOUBLE_TAP and \
+                    max(abs(x - tap[1]), abs(y - tap[2])) <= self.DOUBLE_TAP_SLOP:
+                kind = "double_tap"
+                self._tap = None
+            else:
+                self._tap = (moment, x, y)
+        elif _math.hypot(velocity_x, velocity_y) >= self.FLING_VELOCITY and \
+                max(abs(dis_x), abs(dis_y)) > self.FLING_DISTANCE:
+            kind = "fling"
+        elif max(abs(dis_x), abs(dis_y)) > self.SWIPE_DISTANCE:
+            kind = "swipe"
+        else:
+            kind = "drag"
+        if kind not in ("tap", "double_tap"):
+            self._tap = None
+        return Gesture(kind, x, y, dis_x, dis_y, velocity_x, velocity_y, held=state == "long")
+
+    def cancel(self):
+        self.state = "idle"
+
+    def check_long_press(self, moment):  # 按住超过LONG_PRESS秒且没有移动时返回一次long_press
+        if self.state == "down" and moment - self._down_time >= self.LONG_PRESS:
+            self.state = "long"
+            self._tap = None
+            return Gesture("long_press", self._start[0], self._start[1], held=True)
+        return None
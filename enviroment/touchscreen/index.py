@@ -0,0 +1,75 @@
+# 触摸命中测试的空间索引
+class TouchIndex:
+    """
+    把触摸记录按区域(x_start, x_end, y_start, y_end)放进覆盖296x128屏幕的粗网格，query只检查触点所在格子里的记录
+    records中越靠后的记录越在上层，query按从上到下的顺序产生命中的记录
+    """
+    CELL = 16
+    COLUMNS = 296 // CELL + 1
+    ROWS = 128 // CELL + 1
+
+    def __init__(self, records=()):
+        self.records = []
+        self._cells = [[] for _ in range(self.COLUMNS * self.ROWS)]
+        self.extend(records)
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def __len__(self):
+        return len(self.records)
+
+    @classmethod
+    def _span(cls, start, end, count):
+        return max(min(start // cls.CELL, count - 1), 0), max(min(end // cls.CELL, count - 1), 0)
+
+    def extend(self, records):  # 在最上层追加记录
+        for record in records:
+            x_start, x_end, y_start, y_end = record.area
+            column_start, column_end = self._span(x_start, x_end, self.COLUMNS)
+            row_start, row_end = self._span(y_start, y_end, self.ROWS)
+            for row in range(row_start, row_end + 1):
+                for column in range(column_start, column_end + 1):
+                    self._cells[row * self.COLUMNS + column].append(record)
+            self.records.append(record)
+
+    def update(self, records):
+        """
+        换成records：与现有记录相同时什么也不做，只在末尾追加了记录时增量插入，否则重建
+        """
+        count = len(self.records)
+        if len(records) >= count and all(a is b for a, b in zip(self.records, records)):
+            if len(records) > count:
+                self.extend(records[count:])
+            return
+        self.records = []
+        self._cells = [[] for _ in range(self.COLUMNS * self.ROWS)]
+        self.extend(records)
+
+    def query(self, x, y):
+        column = max(min(int(x) // self.CELL, self.COLUMNS - 1), 0)
+        row = max(min(int(y) // self.CELL, self.ROWS - 1), 0)
+        cell = self._cells[row * self.COLUMNS + column]
+        for i in range(len(cell) - 1, -1, -1):
+            area = cell[i].area
+            if area[0] <= x <= area[1] and area[2] <= y <= area[3]:
+                yield cell[i]
+
+
+class TouchSnapshot:
+    """
+    一组发布后不再修改的触摸记录和它们的空间索引
+    Page每次更新触摸记录时整体替换它的快照，TouchHandler读到的总是某一次完整的发布，不需要加锁
+    """
+    __slots__ = ("clicked", "slide_x", "slide_y", "gesture", "index")
+    KINDS = ("clicked", "slide_x", "slide_y", "gesture")
+
+    def __init__(self, clicked=(), slide_x=(), slide_y=(), gesture=()):
+        self.clicked = list(clicked)
+        self.slide_x = list(slide_x)
+        self.slide_y = list(slide_y)
+        self.gesture = list(gesture)
+        self.index = TouchIndex(self.clicked + self.slide_x + self.slide_y + self.gesture)
+
+    def replace(self, **lists):  # 替换其中几类记录，返回新的快照
+        return TouchSnapshot(**{kind: lists.get(kind, getattr(self, kind)) for kind in self.KINDS})
@@ -6,8 +6,20 @@ from PIL import ImageDraw as _ImageDraw, \
     Image as _Image
 
 from framework.struct import Page as _Page, Element as _Element, Base as _Base
+from framework import text as _text
+from framework import overlay as _overlay
 from enviroment.touchscreen.events import Clicked as _Clicked, \
-    SlideY as _SlideY, SlideX as _SlideX
+    SlideY as _SlideY
+from enviroment.touchscreen.index import TouchIndex as _TouchIndex
+
+_measure_draw = _ImageDraw.ImageDraw(_Image.new("RGBA", (1, 1)))
+
+
+def _text_extent(xy, text, font, **kwargs):  # 文字绘制在xy处时右下角的坐标
+    if not text:
+        return xy
+    box = _measure_draw.textbbox(xy, text, font, **kwargs)
+    return box[2], box[3]
 
 
 class Elements:
@@ -39,7 +51,7 @@ class Elements:
                      show=True):
             super().__init__(page, location)
             self.color = color
-            self.background = background if background else _Image.new("RGBA", (296, 128), (255, 255, 255, 0))
+            self.background = background  # 为None时图层大小按文字范围计算
             self.text = text
             if font:
                 self._font = font
@@ -55,10 +67,18 @@ class Elements:
                 self.show = value
                 self.page.update(display, refresh)
 
+        def _new_image(self, size):  # 有背景时沿用背景，否则新建刚好容纳内容的透明图层，单色模式下为LA
+            if self.background:
+                return self.background.copy()
+            size = (max(1, _ceil(size[0])), max(1, _ceil(size[1])))
+            if self.page.book.base.env.mono:
+                return _Image.new("LA", size, (255, 0))
+            return _Image.new("RGBA", size, (255, 255, 255, 0))
+
         def update(self, display=True, refresh="a"):
-            self.image = self.background.copy()
+            self.image = self._new_image(_text_extent((0, 0), self.text, self._font))
             self._image_draw = _ImageDraw.ImageDraw(self.image)
-            self._image_draw.text((0, 0), self.text, self.color, self._font)
+            _text.draw_text(self.image, (0, 0), self.text, self.color, self._font, draw=self._image_draw)
             self.page.update(display, refresh)
 
         def set_text(self, value, display=True, refresh="a"):
@@ -107,22 +127,10 @@ class Elements:
             self.update(display, refresh)
 
         def update(self, display=True, refresh="a"):
-            self.image = self.background.copy()
-            self._image_draw = _ImageDraw.ImageDraw(self.image)
             if self.align == "left":
                 x = self.border[0]
             else:
-                length = 0
-                font_size = self._font.size
-                if font_size % 12 == 0:
-                    add = font_size * 2 / 3
-                else:
-                    add = font_size / 2
-                for i in self.text:
-                    if " " <= i <= "~":
-                        length += add
-                    else:
-                        length += font_size
+                length = _text.layout.length(self.text, self._font)
                 if self.align == "center":
                     x = _ceil((self.size[0] - length) / 2)
                 elif self.align == "right":
@@ -130,7 +138,10 @@ class Elements:
                 else:
                     raise ValueError
 
-            self._image_draw.text((x, self.border[1]), self.text, self.color, self._font)
+            right, bottom = _text_extent((x, self.border[1]), self.text, self._font)
+            self.image = self._new_image((max(self.size[0], right), max(self.size[1], bottom)))
+            self._image_draw = _ImageDraw.ImageDraw(self.image)
+            _text.draw_text(self.image, (x, self.border[1]), self.text, self.color, self._font, draw=self._image_draw)
             self.page.update(display, refresh)
 
     class ImageButton(Image):
@@ -140,6 +151,7 @@ class Elements:
             self.size = size
             self.clicked = _Clicked((location[0], location[0] + size[0], location[1], location[1] + size[1]),
                                     self.func)
+            self.clicked.highlight = True
             if show:
                 self.touch_records = [self.clicked]
 
@@ -160,6 +172,7 @@ class Elements:
             self.func = func
             super().__init__(page, location, text, font, font_size, color, background, show)
             self.clicked = _Clicked((location[0], location[0] + size[0], location[1], location[1] + size[1]), self.func)
+            self.clicked.highlight = True
             if show:
                 self.touch_records = [self.clicked]
 
@@ -176,9 +189,11 @@ class Elements:
             self.touch_records[0].func = func
 
         def update(self, display=True, refresh="a"):
-            self.image = self.background.copy()
+            right, bottom = _text_extent(self.border, self.text, self._font)
+            self.image = self._new_image((max(self.size[0], right), max(self.size[1], bottom)))
             self._image_draw = _ImageDraw.ImageDraw(self.image)
-            self._image_draw.text((self.border[0], self.border[1]), self.text, self.color, self._font)
+            _text.draw_text(self.image, (self.border[0], self.border[1]), self.text, self.color, self._font,
+                            draw=self._image_draw)
             self.page.update(display, refresh)
 
     class LabelButton(Label):
@@ -191,6 +206,7 @@ class Elements:
             super().__init__(page, location, size, border, text, font_size, color, background, show, align)
             self.clicked = _Clicked((location[0], location[0] + size[0], location[1], location[1] + size[1]),
                                     self.func)
+            self.clicked.highlight = True
             if show:
                 self.touch_records = [self.clicked]
 
@@ -204,22 +220,11 @@ class Elements:
                 self.page.update(display, refresh)
 
         def update(self, display=True, refresh="a"):
-            self.image = self.background.copy()
-            self._image_draw = _ImageDraw.ImageDraw(self.image)
             font_size = self._font.size
             if self.align == "left":
                 x = self.border[0]
             else:
-                length = 0
-                if font_size % 12 == 0:
-                    add = font_size * 2 / 3
-                else:
-                    add = font_size / 2
-                for i in self.text:
-                    if " " <= i <= "~":
-                        length += add
-                    else:
-                        length += font_size
+                length = _text.layout.length(self.text, self._font)
                 if self.align == "center":
                     x = _ceil((self.size[0] - length) / 2)
                 elif self.align == "right":
@@ -227,7 +232,12 @@ class Elements:
                 else:
                     raise ValueError
 
-            self._image_draw.text((x, _floor((self.size[1] - font_size) / 2)), self.text, self.color, self._font)
+            y = _floor((self.size[1] - font_size) / 2)
+            right, bottom = _text_extent((x, y), self.text, self._font)
+            # 边框的右下角落在(size[0], size[1])上，需要多留一个像素
+            self.image = self._new_image((max(self.size[0] + 1, right), max(self.size[1] + 1, bottom)))
+            self._image_draw = _ImageDraw.ImageDraw(self.image)
+            _text.draw_text(self.image, (x, y), self.text, self.color, self._font, draw=self._image_draw)
 
             if self.border_width:
                 self._image_draw.rectangle((0, 0, self.size[0], self.size[1]),
@@ -242,41 +252,21 @@ class Elements:
         def __init__(self, page, location, size, text="", border=(0, 0), font_size=12, color="black",
                      space=0, show=True, align="left"):
             self.space = space
-            super().__init__(page, location, size, border, text, font_size, color,
-                             background=_Image.new("RGBA", (296, size[1]), (255, 255, 255, 0)), show=show, align=align)
+            super().__init__(page, location, size, border, text, font_size, color, show=show, align=align)
 
         def set_text(self, value, display=True, refresh="a"):
             self.text = value
             self.update(display, refresh)
 
         def update(self, display=True, refresh="a"):
-            text = self.text.split("\n")
-            self.image = self.background.copy()
+            lines = _text.layout.wrap(self.text, self._font, self.size[0] - 2 * self.border[0] - 4)  # 右侧留4像素
+            new_text = "\n".join(lines)
+            # 高度固定为size[1]，超出部分与原来一样被裁掉
+            right, _ = _text_extent(self.border, new_text, self._font, spacing=4 + self.space, align=self.align)
+            self.image = self._new_image((max(self.size[0], right), self.size[1]))
             self._image_draw = _ImageDraw.ImageDraw(self.image)
-            line_length = self.size[0] - 2 * self.border[0] - 4
-            font_size = self._font.size
-            new_text = ""
-            if font_size % 12 == 0:
-                add = font_size * 2 / 3
-            else:
-                add = font_size / 2
-            for i in text:
-                length = add
-                start = 0
-                end = 0
-                for j in i:
-                    if " " <= j <= "~":
-                        length += add
-                        end += 1
-                    else:
-                        length += font_size
-                        end += 1
-                    if length > line_length:
-                        length = 0
-                        new_text += f"{i[start: end]}\n"
-                        start = end
-                new_text += f"{i[start: end]}\n"
-            self._image_draw.text(self.border, new_text, self.color, self._font, space=self.space, align=self.align)
+            _text.draw_text(self.image, self.border, new_text, self.color, self._font, 4 + self.space, self.align,
+                            self._image_draw)
             self.page.update(display, refresh)
 
     # 实现一个多页文本element
@@ -286,10 +276,11 @@ class Elements:
             self.font_size = font_size
             self.at = 0
             self.slide = slide
-            self.content = self.text_split(text, (size[0] - 2 * border[0], size[1] - 2 * border[1]), font_size,
-                                           space)
-            self.guide_line_height = max(10, _ceil(size[1] / len(self.content)))
+            self.space = space
+            self._font = page.book.base.env.get_font(font_size)
             self.guide_line_width = guide_line_width
+            self.content = self.text_split(text, (size[0] - 2 * border[0], size[1] - 2 * border[1]))
+            self.guide_line_height = max(10, _ceil(size[1] / len(self.content)))
             super().__init__(page, location, size, text, border, font_size, color, space, show, align)
 
             self.records = [_SlideY((self.location[0], self.location[0]+self.size[0],
@@ -311,68 +302,29 @@ class Elements:
         def page_num(self):
             return len(self.content)
 
-        @staticmethod
-        def text_split(text, area_size, font_size, space) -> list:
-            if font_size % 12 == 0:
-                add = font_size * 2 / 3
-            else:
-                add = font_size / 2
-
-            length = add
-            height = font_size + space
-
-            result = []
-
-            start = 0
-            cur_text = ""
-            last_line = ""
-            for t in range(len(text)):
-                character = text[t]
-
-                if " " <= character <= "~":
-                    length += add
-                else:
-                    length += font_size
-
-                if character == "\n":
-                    length = add
-                    last_line = text[start: t] + "\n"
-                    start = t + 1
-                    cur_text += last_line
-                    height += font_size
-                elif length > area_size[0]:
-                    length = add
-                    last_line = text[start: t] + "\n"
-                    start = t
-                    cur_text += last_line
-                    height += font_size
-                if height > area_size[1]:
-                    height = font_size*2
-                    length = add
-                    result.append(cur_text)
-                    cur_text = last_line
-                    last_line = ""
-            cur_text += text[start:]
-            last_line = text[start:]
-            result.append(cur_text)
-            height += font_size
-            if height > area_size[1]:
-                result.append(last_line)
-            return result
+        def text_split(self, text, area_size) -> list:  # 按区域大小(宽, 高)分页
+            content = _text.layout.paginate(text, self._font, area_size, 4 + self.space)
+            if len(content) > 1:  # 有多页时右侧画翻页指示线，文字不能进入它的范围
+                content = _text.layout.paginate(text, self._font,
+                                                (area_size[0] - self.guide_line_width - 1, area_size[1]),
+                                                4 + self.space)
+            return content
 
         def set_text(self, value, display=True, refresh="a"):
             self.text = value
-            self.content = self.text_split(value, (self.size[0] - 2 * self.border[0], self.size[1] - 2 * self.border[1])
-                                           , self.font_size, self.space)
+            area_size = (self.size[0] - 2 * self.border[0], self.size[1] - 2 * self.border[1])
+            self.content = self.text_split(value, area_size)
             self.guide_line_height = max(10, _ceil(self.size[1] / len(self.content)))
             self.at = 0
             self.update(display, refresh)
 
         def update(self, display=True, refresh="a"):
-            self.image = self.background.copy()
+            right, _ = _text_extent(self.border, self.content[self.at], self._font, spacing=4 + self.space,
+                                    align=self.align)
+            self.image = self._new_image((max(self.size[0], right), self.size[1]))
             self._image_draw = _ImageDraw.ImageDraw(self.image)
-            self._image_draw.text(self.border, self.content[self.at], self.color, self._font, space=self.space,
-                                  align=self.align)
+            _text.draw_text(self.image, self.border, self.content[self.at], self.color, self._font, 4 + self.space,
+                            self.align, self._image_draw)
             if len(self.content) > 1:
                 y = (self.size[1] - self.guide_line_height)*self.at/len(self.content)
                 self._image_draw.line((self.size[0]-self.border[0]-1, y, self.size[0]-self.border[0]-1,
@@ -434,32 +386,18 @@ class Pages:
                 _Clicked((0, 296, 61, 90), self._handler, 1),
                 _Clicked((0, 296, 91, 120), self._handler, 2),
             ]
+            for i in self.list_clicked:
+                i.highlight = True
             self.list_slide_y = [
                 _SlideY((0, 296, 0, 128), self._slide)
             ]
             self.create_touch_record()
 
         def create_touch_record(self):
-            self.touch_records_rlock.acquire()
-            self.touch_records_clicked = self.list_clicked.copy()
-            self.touch_records_slide_x = []
-            self.touch_records_slide_y = self.list_slide_y.copy()
-            for i in self._elements:
-                for j in i.touch_records:
-                    if isinstance(j, _Clicked):
-                        self.touch_records_clicked.append(j)
-                    elif isinstance(j, _SlideX):
-                        self.touch_records_slide_x.append(j)
-                    elif isinstance(j, _SlideY):
-                        self.touch_records_slide_y.append(j)
-            for j in self._touch_records:
-                if isinstance(j, _Clicked):
-                    self.touch_records_clicked.append(j)
-                elif isinstance(j, _SlideX):
-                    self.touch_records_slide_x.append(j)
-                elif isinstance(j, _SlideY):
-                    self.touch_records_slide_y.append(j)
-            self.touch_records_rlock.release()
+            lists = self.sort_touch_records(self._touch_records)
+            lists["clicked"][:0] = self.list_clicked
+            lists["slide_y"][:0] = self.list_slide_y
+            self.publish_touch_records(**lists)
 
         def set_style(self, index, style=None, display=True):
             if self.styles[index] != style:
@@ -550,8 +488,9 @@ class Pages:
             if self._update:
                 new_image = self.background.copy()
                 draw = _ImageDraw.ImageDraw(new_image)
-                draw.text((10, 7), self.title, "black", self.font)
-                draw.text((256, 8), f"{self.at + 1}/{_ceil(len(self.items) / 3)}", "black", self.font)
+                _text.draw_text(new_image, (10, 7), self.title, "black", self.font, draw=draw)
+                _text.draw_text(new_image, (256, 8), f"{self.at + 1}/{_ceil(len(self.items) / 3)}", "black", self.font,
+                                draw=draw)
                 for i in range(3):
                     index = self.at * 3 + i
                     if index + 1 > len(self.items):
@@ -562,9 +501,9 @@ class Pages:
                     y = 37 + i * 30
                     if self.icons[index]:
                         new_image.paste(self.icons[index], (8, y))
-                        draw.text((35, y + 2), self.items[index], "black", self.font)
+                        _text.draw_text(new_image, (35, y + 2), self.items[index], "black", self.font, draw=draw)
                     else:
-                        draw.text((8, y + 2), self.items[index], "black", self.font)
+                        _text.draw_text(new_image, (8, y + 2), self.items[index], "black", self.font, draw=draw)
                     if self.styles[index]:
                         img = self.styles_img[self.styles[index]]
                         new_image.paste(img[0], (img[-2], y + img[-1]), mask=img[1])
@@ -584,8 +523,10 @@ class Pages:
 
                 self.old_render = new_image
                 self._update = False
+                self.damage = None
                 return new_image.copy()
             else:
+                self.damage = []
                 return self.old_render.copy()
 
     class PageWithTitle(_Page):
@@ -614,6 +555,7 @@ class ThemeBase(_Base):
         self._docker_image = self.env.docker_img
         self._docker_status = False
         self._docker_temp = 0
+        self._overlays = _overlay.OverlayCache(2, mode="L" if env.mono else "RGBA")
 
         self._inactive_records = [_SlideY((0, 296, 0, 30), self.active_docker, limit="+")]
         self._active_records = [_Clicked((60, 100, 0, 30), self.open_applist),
@@ -623,6 +565,8 @@ class ThemeBase(_Base):
                                 _Clicked((142, 172, 0, 30), self.open_app, 1),
                                 _Clicked((172, 202, 0, 30), self.open_app, 2),
                                 ]
+        self._inactive_index = _TouchIndex(self._inactive_records)
+        self._active_index = _TouchIndex(self._active_records)
 
         self.docker_list = []
 
@@ -647,6 +591,7 @@ class ThemeBase(_Base):
                 flag = True
         if flag:
             self.env.Config.set("docker", self.docker_list)
+        self._overlays.invalidate()
 
         super().active(refresh)
 
@@ -669,18 +614,27 @@ class ThemeBase(_Base):
         self._docker_status = False
         self.display()
 
+    def _build_docker(self, builder, docker_list):
+        builder.paste(self._docker_image, (60, 0))
+        x = 112
+        for i in docker_list:
+            builder.paste(self.env.apps[i].icon, (x, 5))
+            x += 30
+
     def render(self) -> _Image:
         if self._docker_status:
             new_image = self.Book.render()
-            new_image.paste(self._docker_image, (60, 0))
-            x = 112
-            for i in self.docker_list:
-                new_image.paste(self.env.apps[i].icon, (x, 5))
-                x += 30
+            self._overlays.get(tuple(self.docker_list), self._build_docker, self.docker_list).apply(new_image)
             return new_image
         else:
             return self.Book.render()
 
+    @property
+    def damage(self):
+        if self._docker_status:
+            return None
+        return self.Book.Page.damage
+
     @property
     def touch_records_clicked(self):
         if self._docker_status:
@@ -695,6 +649,10 @@ class ThemeBase(_Base):
         else:
             return self.Book.Page.touch_records_slide_y + self._inactive_records
 
+    @property
+    def touch_sources(self) -> tuple:  # 程序坞的记录在页面之上，不拼接列表
+        return self._active_index if self._docker_status else self._inactive_index, self.Book.Page.touch_index
+
 
 class AppBase(_Base):
     def __init__(self, env):
@@ -710,6 +668,7 @@ class AppBase(_Base):
         self._control_bar_mask = env.app_control_alpha
         self._control_bar_status = False
         self._control_bar_temp = 0
+        self._overlays = _overlay.OverlayCache(2, mode="L" if env.mono else "RGBA")
         self._inactive_records = [_SlideY((0, 296, 0, 20), self.active_control_bar, limit="+")]
         self._active_records = [_Clicked((266, 296, 0, 30), self.env.back_home),
                                 _Clicked((0, 296, 30, 128), self.close_control_bar),
@@ -717,6 +676,8 @@ class AppBase(_Base):
                                 _Clicked((142, 172, 0, 30), self.open_app, 1),
                                 _Clicked((172, 202, 0, 30), self.open_app, 2),
                                 ]
+        self._inactive_index = _TouchIndex(self._inactive_records)
+        self._active_index = _TouchIndex(self._active_records)
 
         self.docker_list = []
 
@@ -736,28 +697,37 @@ class AppBase(_Base):
                 flag = True
         if flag:
             self.env.Config.set("docker", self.docker_list)
+        self._overlays.invalidate()
         super().active(refresh)
 
+    def _build_control_bar(self, builder, title, clock, docker_list):
+        builder.paste(self._control_bar_image, (0, 0), self._control_bar_mask)
+        builder.paste(self.icon, (6, 6))
+        builder.text((30, 7), title, "black", self._control_bar_font)
+        builder.text((224, 7), clock, "black", self._control_bar_font)
+        x = 112
+        for i in docker_list:
+            builder.paste(self.env.apps[i].icon, (x, 5))
+            x += 30
+
     def render(self):
         if self._control_bar_status:
             new_image = self.Book.render()
-            new_image.paste(self._control_bar_image, (0, 0), mask=self._control_bar_mask)
-            new_image.paste(self.icon, (6, 6))
-            image_draw = _ImageDraw.ImageDraw(new_image)
             title = f"{self.title[:5]}..." if len(self.title) > 4 and self.docker_list else self.title
-            image_draw.text((30, 7), title, fill="black", font=self._control_bar_font)
-            image_draw.text((224, 7), _time.strftime("%H:%M", _time.localtime()), fill="black",
-                            font=self._control_bar_font)
-
-            x = 112
-            for i in self.docker_list:
-                new_image.paste(self.env.apps[i].icon, (x, 5))
-                x += 30
-
+            clock = _time.strftime("%H:%M", _time.localtime())
+            # 控制栏按(标题, 时间, docker)缓存，时间每分钟变化一次
+            self._overlays.get((title, clock, tuple(self.docker_list)), self._build_control_bar, title, clock,
+                               self.docker_list).apply(new_image)
             return new_image
         else:
             return self.Book.render()
 
+    @property
+    def damage(self):
+        if self._control_bar_status:
+            return None
+        return self.Book.Page.damage
+
     def active_control_bar(self, _):
         self._control_bar_temp = _time.time()
         self._control_bar_status = True
@@ -784,3 +754,9 @@ class AppBase(_Base):
             return self.Book.Page.touch_records_slide_y
         else:
             return self.Book.Page.touch_records_slide_y + self._inactive_records
+
+    @property
+    def touch_sources(self) -> tuple:  # 控制栏的记录在页面之上，不拼接列表
+        if self._control_bar_status:
+            return self._active_index, self.Book.Page.touch_index
+        return self._inactive_index, self.Book.Page.touch_index
@@ -0,0 +1,141 @@
+import threading as _threading
+from collections import OrderedDict as _OrderedDict
+
+from PIL import Image as _Image, \
+    ImageChops as _ImageChops
+
+from framework import text as _text
+
+
+class Layer:  # 一张裁剪到内容范围的覆盖图，apply只需一次paste
+    __slots__ = ("image", "mask", "location")
+
+    def __init__(self, image, mask, location):
+        self.image = image
+        self.mask = mask
+        self.location = location
+
+    def apply(self, target):
+        target.paste(self.image, self.location, self.mask)
+
+
+class Overlay:
+    """
+    合成好的覆盖层，由一个或多个Layer组成
+    只有半透明区域互相重叠时才会拆成多个Layer，常见的覆盖层都只有一个
+    """
+
+    def __init__(self, layers):
+        self.layers = layers
+
+    def __bool__(self):
+        return bool(self.layers)
+
+    def apply(self, target):
+        for i in self.layers:
+            i.apply(target)
+
+
+class Builder:
+    """
+    在透明画布上记录一系列paste/text操作，生成与直接在目标图片上依次执行这些操作逐像素相同的覆盖层
+    """
+
+    def __init__(self, size=(296, 128)):
+        self.size = size
+        self._layers = []
+        self._new_layer()
+
+    def _new_layer(self):
+        self._canvas = _Image.new("RGBA", self.size, (0, 0, 0, 0))
+        self._mask = _Image.new("L", self.size, 0)
+        self._layers.append((self._canvas, self._mask))
+
+    def _set_layer(self, canvas, mask):
+        self._canvas, self._mask = canvas, mask
+        self._layers[-1] = (canvas, mask)
+
+    def paste(self, image, location=(0, 0), mask=None):  # 与Image.paste相同，image不是RGBA时会被转换
+        if image.mode != "RGBA":
+            image = image.convert("RGBA")
+        full = _Image.new("RGBA", self.size, (0, 0, 0, 0))
+        full.paste(image, location)
+        if mask is None:  # 直接覆盖，结果与下面的内容无关
+            region = _Image.new("L", self.size, 0)
+            region.paste(255, (location[0], location[1], location[0] + image.width, location[1] + image.height))
+            canvas = self._canvas.copy()
+            canvas.paste(full, (0, 0), region)
+            self._mask.paste(255, (0, 0), region)
+            self._set_layer(canvas, self._mask)
+            return
+        if mask.mode == "RGBA":
+            mask = mask.getchannel("A")
+        elif mask.mode != "L":
+            mask = mask.convert("L")
+        weight = _Image.new("L", self.size, 0)
+        weight.paste(mask, location)
+        covered = weight.point(lambda v: 255 if v else 0)
+        # 半透明叠在半透明上无法合并成一次paste，另起一层
+        partial = self._mask.point(lambda v: 255 if 0 < v < 255 else 0)
+        if _ImageChops.multiply(partial, covered).getbbox():
+            self._new_layer()
+        # 已不透明的地方在画布上混合，透明的地方把图片和透明度原样记下，由apply时混合
+        opaque = self._mask.point(lambda v: 255 if v == 255 else 0)
+        blend = self._canvas.copy()
+        blend.paste(full, (0, 0), weight)
+        copy = self._canvas.copy()
+        copy.paste(full, (0, 0), covered)
+        new_mask = self._mask.copy()
+        new_mask.paste(weight, (0, 0), covered)
+        self._set_layer(_Image.composite(blend, copy, opaque), _Image.composite(self._mask, new_mask, opaque))
+
+    def text(self, xy, text, fill, font):  # 与framework.text.draw_text相同
+        mask = _Image.new("L", self.size, 0)
+        _text.draw_text(mask, xy, text, 255, font)
+        self.paste(_Image.new("RGBA", self.size, fill), (0, 0), mask)
+
+    def finish(self, mode="RGBA") -> Overlay:  # mode为覆盖层图片的模式，单色模式下用L，透明度由蒙版单独保存
+        layers = []
+        for canvas, mask in self._layers:
+            box = mask.getbbox()
+            if box is None:
+                continue
+            mask = mask.crop(box)
+            if mask.getcolors(2) and set(v for _, v in mask.getcolors(2)) <= {0, 255}:
+                mask = mask.convert("1", dither=_Image.NONE)  # 不透明度只有0和255时使用1bit蒙版
+            image = canvas.crop(box)
+            layers.append(Layer(image if mode == "RGBA" else image.convert(mode), mask, box[:2]))
+        return Overlay(layers)
+
+
+class OverlayCache:
+    """
+    按状态缓存合成好的覆盖层
+    get(key, build, *args)在缓存中没有key时调用build(builder, *args)生成；状态以外的内容变化时调用invalidate
+    """
+
+    def __init__(self, capacity=16, size=(296, 128), mode="RGBA"):
+        self.capacity = capacity
+        self.size = size
+        self.mode = mode
+        self._overlays = _OrderedDict()
+        self._lock = _threading.Lock()
+
+    def get(self, key, build, *args) -> Overlay:
+        with self._lock:
+            overlay = self._overlays.get(key)
+            if overlay is not None:
+                self._overlays.move_to_end(key)
+                return overlay
+        builder = Builder(self.size)
+        build(builder, *args)
+        overlay = builder.finish(self.mode)
+        with self._lock:
+            self._overlays[key] = overlay
+            if len(self._overlays) > self.capacity:
+                self._overlays.popitem(last=False)
+        return overlay
+
+    def invalidate(self):
+        with self._lock:
+            self._overlays.clear()
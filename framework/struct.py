@@ -1,4 +1,5 @@
 import abc as _abc
+import contextlib as _contextlib
 import threading as _threading
 from queue import LifoQueue as _LifoQueue
 
@@ -7,6 +8,14 @@ from PIL import Image as _Image
 from enviroment.touchscreen.events import Clicked as _Clicked, \
     SlideY as _SlideY
 from enviroment.touchscreen.events import SlideX as _SlideX
+from enviroment.touchscreen.events import GestureRecord as _GestureRecord
+from enviroment.touchscreen.index import TouchSnapshot as _TouchSnapshot
+from enviroment.compositor import merge_refresh as _merge_refresh
+
+
+class _Batch(_threading.local):  # batch的嵌套深度和块内请求过的最强刷新方式，每个线程各自一份
+    depth = 0
+    refresh = None  # None表示没有请求显示
 
 
 class Element:
@@ -72,25 +81,89 @@ class Element:
         self._touch_records.remove(value)
         self.page.create_touch_record()
 
+    @property
+    def bounding_box(self):  # 当前渲染结果在页面上占据的矩形(left, top, right, bottom)，不显示时为None
+        return _box(self._location, self.render())
+
     @_abc.abstractmethod
     def render(self) -> _Image:
         return None
 
 
+SCREEN_BOX = (0, 0, 296, 128)
+
+
+def mono_mode(image) -> str:  # 单色模式下图片应使用的模式：带透明度的用LA，否则用L
+    if image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info:
+        return "LA"
+    return "L"
+
+
+def _box(location, image):
+    if image is None:
+        return None
+    return location[0], location[1], location[0] + image.width, location[1] + image.height
+
+
+def _intersect(a, b):
+    left, top, right, bottom = max(a[0], b[0]), max(a[1], b[1]), min(a[2], b[2]), min(a[3], b[3])
+    if left < right and top < bottom:
+        return left, top, right, bottom
+    return None
+
+
+def merge_boxes(boxes) -> list:  # 裁剪到屏幕范围内并合并相交的矩形
+    result = []
+    for box in boxes:
+        box = _intersect(box, SCREEN_BOX) if box else None
+        if not box:
+            continue
+        merged = True
+        while merged:
+            merged = False
+            for i in result:
+                if _intersect(i, box):
+                    result.remove(i)
+                    box = min(i[0], box[0]), min(i[1], box[1]), max(i[2], box[2]), max(i[3], box[3])
+                    merged = True
+                    break
+        result.append(box)
+    return result
+
+
 class Page:
     def __init__(self, book):
         self.book = book
         self._elements = []
-        self.touch_records_clicked = []
-        self.touch_records_slide_x = []
-        self.touch_records_slide_y = []
+        self._touch_snapshot = _TouchSnapshot()  # 当前发布的触摸记录，只会被整体替换
         self._background = _Image.new("RGBA", (296, 128), (255, 255, 255, 0))
         self._elements_rlock = _threading.RLock()
-        self.touch_records_rlock = _threading.RLock()
+        self.touch_records_rlock = _threading.RLock()  # 只在更新触摸记录的线程之间互斥，TouchHandler不使用
         self.old_render = self._background
         self._update = True
         self._touch_records = []
 
+        # 脏矩形合成
+        self._layers = []  # 上一次合成时每个元素的(element, image, box)
+        self._dirty = []  # 需要重新合成的矩形
+        self._full_damage = True
+        self.damage = None  # 上一次render改变的矩形列表，None表示整页
+        self._mono_background = (None, None)  # 单色模式下(原背景, 转换后的背景)
+
+        # 批量更新，只推迟调用batch的线程中的update
+        self._batch = _Batch()
+
+    def mark_dirty(self, box=None, display=False, refresh="a"):
+        """
+        标记需要重新合成的区域，box为None时重新合成整页
+        元素换了图片、位置或显示状态时会被自动检测，只有在原图片上直接修改时才需要调用
+        """
+        if box is None:
+            self._full_damage = True
+        else:
+            self._dirty.append(box)
+        self.update(display, refresh)
+
     def active(self):
         pass
 
@@ -103,6 +176,7 @@ class Page:
 
     def set_background(self, value, display=True):
         self._background = value
+        self._full_damage = True
         self.update(display)
 
     @property
@@ -126,6 +200,54 @@ class Page:
         self._touch_records.remove(value)
         self.create_touch_record()
 
+    @property
+    def touch_snapshot(self) -> _TouchSnapshot:
+        return self._touch_snapshot
+
+    @property
+    def touch_index(self):
+        return self._touch_snapshot.index
+
+    def publish_touch_records(self, **lists):
+        """
+        以clicked、slide_x、slide_y、gesture替换对应的触摸记录并发布新的快照，没有给出的类别保持不变
+        发布后不要再原地修改这些列表，需要修改时重新发布
+        """
+        with self.touch_records_rlock:
+            self._touch_snapshot = self._touch_snapshot.replace(**lists)
+
+    @property
+    def touch_records_clicked(self):
+        return self._touch_snapshot.clicked
+
+    @touch_records_clicked.setter
+    def touch_records_clicked(self, value):
+        self.publish_touch_records(clicked=value)
+
+    @property
+    def touch_records_slide_x(self):
+        return self._touch_snapshot.slide_x
+
+    @touch_records_slide_x.setter
+    def touch_records_slide_x(self, value):
+        self.publish_touch_records(slide_x=value)
+
+    @property
+    def touch_records_slide_y(self):
+        return self._touch_snapshot.slide_y
+
+    @touch_records_slide_y.setter
+    def touch_records_slide_y(self, value):
+        self.publish_touch_records(slide_y=value)
+
+    @property
+    def touch_records_gesture(self):
+        return self._touch_snapshot.gesture
+
+    @touch_records_gesture.setter
+    def touch_records_gesture(self, value):
+        self.publish_touch_records(gesture=value)
+
     @staticmethod
     def _get_sort_key_from(element: Element) -> int:
         return element.layer
@@ -141,54 +263,123 @@ class Page:
     def resort(self):
         self._elements_rlock.acquire()
         self._elements.sort(key=self._get_sort_key_from, reverse=True)
+        self._full_damage = True
         self._elements_rlock.release()
         self.create_touch_record()
 
     def create_touch_record(self):
-        self.touch_records_rlock.acquire()
-        self.touch_records_clicked = []
-        self.touch_records_slide_x = []
-        self.touch_records_slide_y = []
-        for i in self._elements:
-            for j in i.touch_records:
-                if isinstance(j, _Clicked):
-                    self.touch_records_clicked.append(j)
-                elif isinstance(j, _SlideX):
-                    self.touch_records_slide_x.append(j)
-                elif isinstance(j, _SlideY):
-                    self.touch_records_slide_y.append(j)
-        for j in self._touch_records:
+        self.publish_touch_records(**self.sort_touch_records(self._touch_records))
+
+    def sort_touch_records(self, records) -> dict:  # 把元素和records中的触摸记录按类别分开
+        lists = {"clicked": [], "slide_x": [], "slide_y": [], "gesture": []}
+        with self._elements_rlock:
+            records = [j for i in self._elements for j in i.touch_records] + list(records)
+        for j in records:
             if isinstance(j, _Clicked):
-                self.touch_records_clicked.append(j)
+                lists["clicked"].append(j)
             elif isinstance(j, _SlideX):
-                self.touch_records_slide_x.append(j)
+                lists["slide_x"].append(j)
             elif isinstance(j, _SlideY):
-                self.touch_records_slide_y.append(j)
-        self.touch_records_rlock.release()
+                lists["slide_y"].append(j)
+            elif isinstance(j, _GestureRecord):
+                lists["gesture"].append(j)
+        return lists
+
+    def _collect_damage(self, layers):
+        if self._full_damage or self.old_render.size != self._background.size:
+            return None
+        damage = self._dirty
+        old = {id(element): (image, box) for element, image, box in self._layers}
+        for element, image, box in layers:
+            old_image, old_box = old.pop(id(element), (None, None))
+            if old_image is not image or old_box != box:
+                damage.append(old_box)
+                damage.append(box)
+        for _, old_box in old.values():
+            damage.append(old_box)
+        damage = merge_boxes(damage)
+        area = sum((i[2] - i[0]) * (i[3] - i[1]) for i in damage)
+        if area * 2 > self._background.width * self._background.height:  # 变化太大时直接整页合成
+            return None
+        return damage
+
+    @staticmethod
+    def _paste_layer(target, image, location, box=None):
+        if box:
+            image = image.crop((box[0] - location[0], box[1] - location[1],
+                                box[2] - location[0], box[3] - location[1]))
+            location = box[:2]
+        if image.mode in ("RGBA", "LA"):
+            target.paste(image, location, mask=image.getchannel("A"))
+        else:
+            target.paste(image, location)
+
+    def _composite_background(self):  # 合成时使用的背景，单色模式下转换为L/LA并缓存
+        if not self.book.base.env.mono:
+            return self._background
+        if self._mono_background[0] is not self._background:
+            self._mono_background = (self._background, self._background.convert(mono_mode(self._background)))
+        return self._mono_background[1]
 
     def render(self):
         if self._update:
-            new_image = self._background.copy()
+            background = self._composite_background()
             self._elements_rlock.acquire()
+            layers = []
             for i in self._elements:
                 j = i.render()
-                if j:
-                    if j.mode == "RGBA":
-                        _, _, _, a = j.split()
-                        new_image.paste(j, i.location, mask=a)
-                    else:
-                        new_image.paste(j, i.location)
+                layers.append((i, j, _box(i.location, j)))
+            damage = self._collect_damage(layers)
+            if damage is None:
+                new_image = background.copy()
+                for i, j, _ in layers:
+                    if j:
+                        self._paste_layer(new_image, j, i.location)
+                self.damage = None
+            else:
+                new_image = self.old_render.copy()
+                for rect in damage:
+                    new_image.paste(background.crop(rect), rect[:2])
+                    for i, j, box in layers:
+                        box = _intersect(box, rect) if j else None
+                        if box:
+                            self._paste_layer(new_image, j, i.location, box)
+                self.damage = damage
             self._elements_rlock.release()
+            self._layers = layers
+            self._dirty = []
+            self._full_damage = False
             self.old_render = new_image
             self._update = False
             return new_image.copy()
         else:
+            self.damage = []
             return self.old_render.copy()
 
+    @_contextlib.contextmanager
+    def batch(self):
+        """
+        with page.batch(): 块内的update只做标记，退出时合并为一次渲染和显示，刷新方式取块内请求过的最强的一个
+        可以嵌套，只在最外层退出时显示；只作用于当前线程，其他线程中的update照常显示
+        """
+        batch = self._batch
+        batch.depth += 1
+        try:
+            yield self
+        finally:
+            batch.depth -= 1
+            if not batch.depth and batch.refresh is not None:
+                refresh, batch.refresh = batch.refresh, None
+                self.book.update(self, refresh)
+
     def update(self, display=True, refresh="a"):
         self._update = True
         if display:
-            self.book.update(self, refresh)
+            batch = self._batch
+            if batch.depth:
+                batch.refresh = _merge_refresh(batch.refresh, refresh)
+            else:
+                self.book.update(self, refresh)
 
 
 class Book:
@@ -198,9 +389,23 @@ class Book:
         self.Page = None
         self.now_page = ""
         self._active = False
+        self._batch = _Batch()
 
         self.back_stack = _LifoQueue()
 
+    @_contextlib.contextmanager
+    def batch(self):  # 与Page.batch相同，作用于整个Book，块内切换页面也只显示一次
+        batch = self._batch
+        batch.depth += 1
+        try:
+            yield self
+        finally:
+            batch.depth -= 1
+            if not batch.depth and batch.refresh is not None:
+                refresh, batch.refresh = batch.refresh, None
+                if self._active:
+                    self.base.display(refresh)
+
     def active(self):
         self._active = True
         self.Page.active()
@@ -220,7 +425,7 @@ class Book:
 
     def change_to(self, display=True):
         if display:
-            self.base.display()
+            self._display()
 
     def change_page(self, target: str, to_stack=True, display=True):
         if target in self.Pages:
@@ -238,16 +443,24 @@ class Book:
             self.now_page = target
             self.Page = self.Pages[target]
             self.Page.active()
-            self.base.display(display)
+            if display:
+                self._display()
         else:
             raise KeyError("The targeted page is not found.")
 
     def render(self) -> _Image:
         return self.Page.render()
 
+    def _display(self, refresh="a"):
+        batch = self._batch
+        if batch.depth:
+            batch.refresh = _merge_refresh(batch.refresh, refresh)
+        else:
+            self.base.display(refresh)
+
     def update(self, page, refresh="a"):
         if page is self.Pages[self.now_page] and self._active:
-            self.base.display(refresh)
+            self._display(refresh)
 
     def back(self) -> bool:
         if self.back_stack.empty():
@@ -308,6 +521,14 @@ class Base:
     def touch_records_clicked(self):
         return self.Book.Page.touch_records_clicked
 
+    @property
+    def touch_records_gesture(self):
+        return self.Book.Page.touch_records_gesture
+
+    @property
+    def touch_sources(self) -> tuple:  # 交给TouchHandler查询的TouchIndex，从上层到下层
+        return self.Book.Page.touch_index,
+
     def is_active(self):
         return self._active
 
@@ -330,6 +551,10 @@ class Base:
     def render(self) -> _Image:
         return self.Book.render()
 
+    @property
+    def damage(self):  # 上一次render改变的矩形列表，None表示整屏；有覆盖层时子类应返回None
+        return self.Book.Page.damage
+
     def active(self, refresh="a") -> None:  # This function will be called when this Base is active.
         self._active = True
         self.Book.active()
@@ -0,0 +1,196 @@
+import threading as _threading
+from collections import OrderedDict as _OrderedDict
+
+from PIL import ImageDraw as _ImageDraw, \
+    Image as _Image
+
+
+class GlyphAtlas:
+    """
+    点阵字体的字形缓存
+    VonwaonBitmap在12/16的整数倍下没有抗锯齿，每个字形光栅化一次后保存为1bit小图，之后直接贴图即可，
+    结果与ImageDraw.text逐像素一致。只缓存通过register登记过的字体，缓存按LRU淘汰
+    """
+
+    def __init__(self, capacity=2048):
+        self.capacity = capacity
+        self._fonts = set()
+        self._glyphs = _OrderedDict()
+        self._lock = _threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def register(self, font):
+        self._fonts.add(id(font))
+        return font
+
+    def supports(self, font) -> bool:
+        return id(font) in self._fonts
+
+    @staticmethod
+    def _rasterize(font, character):
+        left, top, right, bottom = font.getbbox(character)
+        x, y = 2 - min(left, 0), 2 - min(top, 0)
+        image = _Image.new("L", (x + max(right, 1) + 2, y + max(bottom, 1) + 2), 0)
+        _ImageDraw.ImageDraw(image).text((x, y), character, 255, font)
+        box = image.getbbox()
+        advance = int(font.getlength(character))
+        if box is None:  # 空格等不可见字符
+            return None, (0, 0), advance
+        return image.crop(box).convert("1"), (box[0] - x, box[1] - y), advance
+
+    def get(self, font, character):  # 返回(sprite, offset, advance)
+        key = (id(font), character)
+        with self._lock:
+            glyph = self._glyphs.get(key)
+            if glyph is not None:
+                self._glyphs.move_to_end(key)
+                self.hits += 1
+                return glyph
+        glyph = self._rasterize(font, character)
+        with self._lock:
+            self.misses += 1
+            self._glyphs[key] = glyph
+            if len(self._glyphs) > self.capacity:
+                self._glyphs.popitem(last=False)
+        return glyph
+
+    def clear(self):
+        with self._lock:
+            self._glyphs.clear()
+
+    def draw_line(self, image, xy, text, fill, font):
+        x, y = xy
+        for i in text:
+            sprite, offset, advance = self.get(font, i)
+            if sprite:
+                image.paste(fill, (x + offset[0], y + offset[1]), sprite)
+            x += advance
+
+
+atlas = GlyphAtlas()
+
+
+def draw_text(image, xy, text, fill, font, spacing=4, align="left", draw=None):
+    """
+    ImageDraw.text的替代，已登记的点阵字体在整数坐标上使用字形缓存，其余情况交给ImageDraw.text
+    """
+    if not atlas.supports(font):
+        (draw or _ImageDraw.ImageDraw(image)).text(xy, text, fill, font, spacing=spacing, align=align)
+        return
+    lines = text.split("\n")
+    if len(lines) == 1:
+        _draw_line(image, xy, text, fill, font, draw)
+        return
+    # 与ImageDraw.multiline_text相同的排版
+    line_spacing = layout.line_height(font) + spacing
+    widths = [layout.length(i, font) for i in lines]
+    max_width = max(widths)
+    top = xy[1]
+    for line, width in zip(lines, widths):
+        left = xy[0]
+        if align == "center":
+            left += (max_width - width) / 2.0
+        elif align == "right":
+            left += max_width - width
+        elif align != "left":
+            raise ValueError('align must be "left", "center" or "right"')
+        _draw_line(image, (left, top), line, fill, font, draw)
+        top += line_spacing
+
+
+def _draw_line(image, xy, text, fill, font, draw):
+    if xy[0] == int(xy[0]) and xy[1] == int(xy[1]):
+        atlas.draw_line(image, (int(xy[0]), int(xy[1])), text, fill, font)
+    else:  # 非整数坐标时FreeType会做亚像素偏移，交给ImageDraw处理
+        (draw or _ImageDraw.ImageDraw(image)).text(xy, text, fill, font)
+
+
+class TextLayout:
+    """
+    文字测量与换行
+    字宽取自字体的真实度量并按(字体, 字符)缓存；换行结果按(文字, 字体, 宽度)缓存。
+    文字只是在末尾追加内容时，从上一次结果的最后一行开始重新排版
+    """
+
+    def __init__(self, capacity=256):
+        self.capacity = capacity
+        self._advances = {}
+        self._line_heights = {}
+        self._results = _OrderedDict()
+        self._last = {}  # (字体, 宽度) -> (文字, 每行内容, 每行起点)
+        self._lock = _threading.Lock()
+
+    def advance(self, font, character) -> int:
+        key = (id(font), character)
+        try:
+            return self._advances[key]
+        except KeyError:
+            self._advances[key] = value = int(font.getlength(character))
+            return value
+
+    def length(self, text, font) -> int:
+        return sum(self.advance(font, i) for i in text)
+
+    def line_height(self, font) -> int:  # 不含行距的行高，与ImageDraw.multiline_text一致
+        try:
+            return self._line_heights[id(font)]
+        except KeyError:
+            self._line_heights[id(font)] = value = font.getbbox("A")[3]
+            return value
+
+    def _wrap_from(self, text, font, width, start):
+        lines = []
+        starts = []
+        line_start = start
+        length = 0
+        for index in range(start, len(text)):
+            character = text[index]
+            if character == "\n":
+                lines.append(text[line_start: index])
+                starts.append(line_start)
+                line_start = index + 1
+                length = 0
+                continue
+            add = self.advance(font, character)
+            if length + add > width and index > line_start:  # 每行至少放一个字
+                lines.append(text[line_start: index])
+                starts.append(line_start)
+                line_start = index
+                length = 0
+            length += add
+        lines.append(text[line_start:])
+        starts.append(line_start)
+        return lines, starts
+
+    def wrap(self, text, font, width) -> list:  # 按宽度换行，返回每一行的内容
+        key = (text, id(font), width)
+        with self._lock:
+            lines = self._results.get(key)
+            if lines is not None:
+                self._results.move_to_end(key)
+                return list(lines)
+            last = self._last.get(key[1:])
+        if last and text.startswith(last[0]):  # 只追加了内容，前面的行不会变化
+            lines, starts = self._wrap_from(text, font, width, last[2][-1])
+            lines, starts = last[1][:-1] + lines, last[2][:-1] + starts
+        else:
+            lines, starts = self._wrap_from(text, font, width, 0)
+        with self._lock:
+            self._last[key[1:]] = (text, lines, starts)
+            self._results[key] = tuple(lines)
+            if len(self._results) > self.capacity:
+                self._results.popitem(last=False)
+        return list(lines)
+
+    def paginate(self, text, font, size, spacing=4) -> list:
+        """
+        按区域大小(宽, 高)分页，返回每一页的文字；spacing为行距，与draw_text一致
+        """
+        lines = self.wrap(text, font, size[0])
+        line_height = self.line_height(font)
+        per_page = max(1, (size[1] - line_height) // (line_height + spacing) + 1)
+        return ["\n".join(lines[i: i + per_page]) for i in range(0, len(lines), per_page)]
+
+
+layout = TextLayout()
@@ -1,4 +1,5 @@
 import os
+import sys
 import threading
 import importlib
 import time
@@ -93,14 +94,23 @@ def main_thread():
 
 
 """
-    while 1:  # 据说 while 1 的效率比 while True 高
-        env.Touch.icnt_scan(touch_recoder_dev, touch_recoder_old)
-        env.TouchHandler.handle(touch_recoder_dev, touch_recoder_old)
+    # 硬件上由INT中断驱动采集，见enviroment.drivers.touch_acquisition
+    rate = env.touch_sample_rate
+    acquisition = TouchAcquisition(env.Touch, handler=env.Logger.error, min_interval=1 / rate if rate else 0)
+    acquisition.start()
+    acquisition.pump(env.TouchHandler.handle, touch_recoder_dev, touch_recoder_old)
 """
 
 
 if __name__ == "__main__":
-    simulator = enviroment.Simulator()
+    # python3 main.py --headless：不打开模拟器窗口，画面保存在内存中，见enviroment.Headless
+    if "--headless" in sys.argv:
+        simulator = enviroment.Headless()
+    else:
+        simulator = enviroment.Simulator(stats="--stats" in sys.argv)  # --stats：在标题栏显示帧率和延迟
     env = enviroment.Env(simulator)
+    # python3 main.py --record session.rec：录制触摸和画面，用python3 -m benchmarks.replay session.rec回放
+    if "--record" in sys.argv[:-1]:
+        env.start_recording(sys.argv[sys.argv.index("--record") + 1])
     env.Pool.add(main_thread)
     simulator.start(env)
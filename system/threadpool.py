@@ -6,6 +6,8 @@ import time
 import traceback
 from queue import Queue
 
+from system import tracing
+
 
 def _async_raise(tid, exc_type):
     """raises the exception, performs cleanup if needed"""
@@ -101,8 +103,8 @@ class ThreadPool:
         for i in self.threads:
             i.start()
 
-    def add(self, func, *args, **kwargs):
-        self.tasks.put((func, args, kwargs))
+    def add(self, func, *args, **kwargs):  # 任务带上添加时的追踪，在执行它的线程中继续追踪
+        self.tasks.put((func, args, kwargs, tracing.current(), time.perf_counter()))
 
     def add_immediately(self, func, *args, **kwargs):
         """
@@ -113,7 +115,7 @@ class ThreadPool:
             new_thread.start()
             return new_thread
         else:
-            self.tasks.put((func, args, kwargs))
+            self.add(func, *args, **kwargs)
 
     def stop(self):  # TODO: join
         self.running = False
@@ -167,7 +169,11 @@ class Worker(threading.Thread):
             try:
                 task = self.tasks.get(block=True, timeout=2)
                 self.start_log()
-                task[0](*task[1], **task[2])
+                if task[3]:
+                    tracing.record("queue", time.perf_counter() - task[4], task[3])
+                tracing.activate(task[3])
+                with tracing.stage("callback"):
+                    task[0](*task[1], **task[2])
                 self.finish_log()
             except queue.Empty:
                 pass
@@ -0,0 +1,144 @@
+# 触摸到屏幕刷新的延迟追踪：每个触摸采样带一个Trace，经过的线程把它设为当前追踪，各阶段的耗时记入直方图
+import itertools
+import threading
+import time
+
+STAGES = (
+    "dispatch",  # 采样到分发线程处理完
+    "queue",  # 在线程池队列中等待
+    "callback",  # 应用的回调
+    "compose_wait",  # 请求显示到Compositor开始渲染(帧窗口和合并)
+    "render",  # Env._compose，即Page.render和系统层
+    "display_wait",  # 提交画面到显示线程开始显示(等待屏幕空闲)
+    "convert",  # 画面转换为buffer，包含在refresh中
+    "refresh",  # 屏幕驱动的整个显示调用
+    "total",  # 采样到第一次包含它的画面显示完成
+)
+
+_local = threading.local()
+
+
+class Histogram:
+    """
+    以毫秒为单位、按2的幂划分的直方图：第i个桶为(BOUNDS[i-1], BOUNDS[i]]，最后一个桶收集超过BOUNDS[-1]的值
+    """
+    BOUNDS = tuple(0.25 * 2 ** i for i in range(16))  # 0.25ms到8192ms
+
+    def __init__(self):
+        self.buckets = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def add(self, milliseconds):
+        index = 0
+        while index < len(self.BOUNDS) and milliseconds > self.BOUNDS[index]:
+            index += 1
+        self.buckets[index] += 1
+        self.count += 1
+        self.sum += milliseconds
+        self.max = max(self.max, milliseconds)
+
+    def percentile(self, q):  # 近似值：第q分位数所在桶的上界，不超过最大值
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= target:
+                return min(self.BOUNDS[index], self.max) if index < len(self.BOUNDS) else self.max
+        return self.max
+
+    @property
+    def report(self) -> dict:
+        return {"count": self.count, "mean": round(self.sum / self.count, 3) if self.count else 0.0,
+                "p50": round(self.percentile(0.5), 3), "p90": round(self.percentile(0.9), 3),
+                "p99": round(self.percentile(0.99), 3),
+                "max": round(self.max, 3), "buckets": list(self.buckets)}
+
+
+class Trace:
+    __slots__ = ("id", "start", "tracer", "done")
+
+    def __init__(self, tracer, start):
+        self.id = next(tracer.ids)
+        self.start = start  # time.perf_counter()
+        self.tracer = tracer
+        self.done = False  # 已经记录过total
+
+    def finish(self, moment):  # 包含这个采样的画面显示完成，只记录第一次
+        if not self.done:
+            self.done = True
+            self.tracer.record("total", moment - self.start)
+
+
+class Tracer:
+    def __init__(self):
+        self.ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.histograms = {stage: Histogram() for stage in STAGES}
+        self.started = 0
+
+    def begin(self, start=None) -> Trace:
+        self.started += 1
+        return Trace(self, time.perf_counter() if start is None else start)
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self.histograms[stage].add(seconds * 1000)
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {stage: Histogram() for stage in STAGES}
+            self.started = 0
+
+    @property
+    def report(self) -> dict:  # 各阶段的次数和毫秒数
+        with self._lock:
+            return {"started": self.started,
+                    "stages": {stage: histogram.report for stage, histogram in self.histograms.items()}}
+
+    def summary(self) -> str:  # 写入日志的一段文字，没有记录的阶段不列出
+        lines = ["触摸延迟(ms): 阶段 次数 平均 p50 p90 p99 最大"]
+        for stage, report in self.report["stages"].items():
+            if report["count"]:
+                lines.append(f"{stage} {report['count']} {report['mean']} {report['p50']} {report['p90']} "
+                             f"{report['p99']} {report['max']}")
+        return "\n".join(lines)
+
+
+tracer = Tracer()
+
+
+def current() -> tuple:  # 当前线程正在处理的追踪
+    return getattr(_local, "traces", ())
+
+
+def activate(traces):  # 把traces设为当前线程的追踪，处理完后以()调用
+    _local.traces = tuple(traces)
+
+
+def record(stage, seconds, traces=None):  # 为traces(默认为当前追踪)中的每一个记录一次stage
+    for trace in current() if traces is None else traces:
+        trace.tracer.record(stage, seconds)
+
+
+class stage:
+    """
+    with stage("convert"): ... 为当前追踪记录这段代码的耗时，没有追踪时几乎没有开销
+    """
+    __slots__ = ("name", "_traces", "_start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self._traces = current()
+        if self._traces:
+            self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *_):
+        if self._traces:
+            record(self.name, time.perf_counter() - self._start, self._traces)
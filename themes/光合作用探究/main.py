@@ -226,36 +226,38 @@ class MainPage(lib.Pages.PageWithTitle):
 
     def status_handler(self, status: Status):
         self.status_bool = status.status
-        # 更新按钮文字
-        if status.status:
-            self.control_button.set_text("停止", False)
-        else:
-            self.control_button.set_text("开始", False)
-        # 更新运行状态
-        if status.status:
-            self.status.set_text("运行状态：运行中", False)
-        else:
-            self.status.set_text("运行状态：空闲", False)
-        # 更新培养箱状态
-        if status.box:
-            self.box.set_text("培养箱：在线", False)
-        else:
-            self.box.set_text("培养箱：离线", False)
-        # 更新服务器状态
-        if status.server:
-            self.server.set_text("服务器: 已连接")
-        else:
-            self.server.set_text("服务器: 未连接")
+        with self.batch():
+            # 更新按钮文字
+            if status.status:
+                self.control_button.set_text("停止")
+            else:
+                self.control_button.set_text("开始")
+            # 更新运行状态
+            if status.status:
+                self.status.set_text("运行状态：运行中")
+            else:
+                self.status.set_text("运行状态：空闲")
+            # 更新培养箱状态
+            if status.box:
+                self.box.set_text("培养箱：在线")
+            else:
+                self.box.set_text("培养箱：离线")
+            # 更新服务器状态
+            if status.server:
+                self.server.set_text("服务器: 已连接")
+            else:
+                self.server.set_text("服务器: 未连接")
 
     def data_handler(self, data: Data):
-        # 更新温度
-        self.temp.set_text(str(data.temp) + "℃", False)
-        # 更新湿度
-        self.humi.set_text(str(data.humi) + "%", False)
-        # 更新氧气含量
-        self.oxygen.set_text(str(data.oxygen) + "%", False)
-        # 更新光照
-        self.light.set_text(str(data.light) + "lx")
+        with self.batch():
+            # 更新温度
+            self.temp.set_text(str(data.temp) + "℃")
+            # 更新湿度
+            self.humi.set_text(str(data.humi) + "%")
+            # 更新氧气含量
+            self.oxygen.set_text(str(data.oxygen) + "%")
+            # 更新光照
+            self.light.set_text(str(data.light) + "lx")
 
     def exit(self):
         self.connector.disactive()
@@ -1,4 +1,3 @@
-import threading
 import time
 
 from PIL import ImageFont, ImageDraw, Image
@@ -44,7 +43,6 @@ class Theme(ThemeBase):
         self.Books["main"] = self.Book
         self.now_book = "main"
         self.flag = False
-        self.last_update = -1
 
     @property
     def preview(self):
@@ -55,21 +53,16 @@ class Theme(ThemeBase):
         draw_image.text((58, 32), "10 : 09", font=font)
         return img
 
-    def updater(self):
-        while 1:
-            if self.flag:
-                if self.last_update != time.localtime(time.time()).tm_min:
-                    self.last_update = time.localtime(time.time()).tm_min
-                    self.Book.Page.update()
-            else:
-                return
-            time.sleep(2)
+    def updater(self):  # 由env.Power每分钟调用
+        if self.flag:
+            self.Book.Page.update()
 
     def active(self, refresh="a"):
         super().active(refresh)
         self.flag = True
-        threading.Thread(target=self.updater, daemon=True).start()
+        self.env.Power.add_tick(self.updater)
 
     def pause(self):
         super().pause()
         self.flag = False
+        self.env.Power.remove_tick(self.updater)